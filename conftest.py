@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_files():
+    """Файлы тестов — во временном каталоге, а не рядом с проектом."""
+    from core.testing import isolated_files
+
+    with isolated_files():
+        yield
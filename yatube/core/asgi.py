@@ -0,0 +1,261 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections
+
+# Заголовки, которые в WSGI идут без префикса HTTP_.
+PLAIN_HEADERS = {'CONTENT_TYPE', 'CONTENT_LENGTH'}
+# Ключ environ (request.META) запросов, пришедших через ASGIHandler.
+ASGI_KEY = 'yatube.asgi'
+_DONE = object()
+TOO_LARGE = 'Слишком большой запрос.'.encode()
+
+
+def max_body_size():
+    """Предел тела запроса; None — без предела.
+
+    Поля формы Django ограничивает DATA_UPLOAD_MAX_MEMORY_SIZE, картинку
+    поста — POST_IMAGE_MAX_SIZE: тело больше их суммы дочитывать незачем.
+    """
+    if settings.DATA_UPLOAD_MAX_MEMORY_SIZE is None:
+        return None
+    return settings.DATA_UPLOAD_MAX_MEMORY_SIZE + settings.POST_IMAGE_MAX_SIZE
+
+
+def content_length(scope):
+    for name, value in scope.get('headers', []):
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def in_thread(function, *args):
+    """Вызов в потоке пула; соединения с базой закрываются в нём же.
+
+    Соединения Django свои у каждого потока, а request_finished
+    закрывает только соединения того потока, где вызван close().
+    """
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+def build_environ(scope, body):
+    """WSGI environ для HTTP-запроса ASGI; `body` — файл с телом."""
+    path = scope['path']
+    root = scope.get('root_path', '')
+    if root and path.startswith(root):
+        path = path[len(root):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    body.seek(0, 2)
+    size = body.tell()
+    body.seek(0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root,
+        # WSGI передаёт путь байтами в latin-1, как он пришёл по сети.
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        # Тело уже прочитано целиком, длина известна и без заголовка.
+        'CONTENT_LENGTH': str(size),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        ASGI_KEY: True,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name not in PLAIN_HEADERS:
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+class ASGIHandler:
+    """ASGI-приложение поверх WSGI-обработчика Django.
+
+    Django 2.2 не умеет асинхронные view и асинхронный ORM, поэтому
+    view выполняются как прежде, но в пуле из `ASGI_THREADS` потоков.
+    Цикл событий сам дочитывает тело запроса до того, как занять
+    поток, и сам отдаёт ответ по частям: медленная загрузка картинки
+    или медленный клиент держат только сокет, а не поток с базой.
+    Тело больше `max_body_size()` получает 413, не дочитываясь.
+    """
+
+    def __init__(self, application=None, threads=None):
+        self.application = application or get_wsgi_application()
+        self.executor = ThreadPoolExecutor(
+            threads or settings.ASGI_THREADS, thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемый тип соединения: {scope}')
+        body = await self.read_body(scope, receive, send)
+        if body is None:
+            return
+        with body:
+            await self.respond(build_environ(scope, body), receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, scope, receive, send):
+        """Тело запроса в файле.
+
+        None, если клиент ушёл, не дослав его, или тело больше предела:
+        тогда ответ 413 уже отправлен.
+        """
+        limit = max_body_size()
+        declared = content_length(scope)
+        if limit is not None and declared is not None and declared > limit:
+            await self.too_large(send)
+            return None
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit is not None and size > limit:
+                body.close()
+                await self.too_large(send)
+                return None
+            body.write(chunk)
+            if not message.get('more_body', False):
+                return body
+
+    async def too_large(self, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [
+                (b'content-type', b'text/plain; charset=utf-8'),
+                (b'connection', b'close'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': TOO_LARGE})
+
+    async def respond(self, environ, receive, send):
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        result = await loop.run_in_executor(
+            self.executor, in_thread, self.application, environ,
+            start_response,
+        )
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        chunks = self.chunks(result, loop)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': started['status'],
+                'headers': started['headers'],
+            })
+            while True:
+                chunk = asyncio.ensure_future(self.next_chunk(chunks))
+                await asyncio.wait(
+                    {chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not chunk.done():
+                    # Асинхронный ответ прерывается сразу; поток пула
+                    # прервать нельзя, его часть дожидаемся.
+                    if hasattr(result, '__aiter__'):
+                        chunk.cancel()
+                    await asyncio.wait({chunk})
+                    break
+                body = chunk.result()
+                if body is _DONE:
+                    break
+                if body:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': body,
+                        'more_body': True,
+                    })
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            await chunks.aclose()
+            # close() отправляет request_finished; соединения с базой
+            # закрывает in_thread в каждом потоке, где шёл запрос.
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(
+                    self.executor, in_thread, result.close
+                )
+
+    async def next_chunk(self, chunks):
+        try:
+            return await chunks.__anext__()
+        except StopAsyncIteration:
+            return _DONE
+
+    async def chunks(self, result, loop):
+        """Части ответа.
+
+        Асинхронный ответ (поток событий) читается прямо в цикле событий
+        и не занимает поток, пока ждёт. Части обычного потокового ответа
+        собираются в пуле: итератор может читать базу.
+        """
+        if hasattr(result, '__aiter__'):
+            async for chunk in result:
+                yield chunk
+            return
+        chunks = iter(result)
+        while True:
+            chunk = await loop.run_in_executor(
+                self.executor, in_thread, next, chunks, _DONE
+            )
+            if chunk is _DONE:
+                return
+            yield chunk
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
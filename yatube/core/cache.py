@@ -0,0 +1,515 @@
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.signals import request_started
+from django.dispatch import receiver
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+'''
+INVALIDATIONS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL
+);
+'''
+# Ключ в журнале, после которого процессы очищают L1 целиком.
+EVERYTHING = '*'
+_MISS = object()
+# SQLite ограничивает число параметров запроса.
+CHUNK_SIZE = 500
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteFile:
+    """Соединение с файлом SQLite в режиме WAL: своё у потока и процесса."""
+    schema = ''
+
+    def __init__(self, path, busy_timeout=5):
+        self._path = path
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединение не переживает fork: у воркера gunicorn своё.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(
+                self._path, timeout=self._busy_timeout, isolation_level=None
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(self.schema)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db
+        # IMMEDIATE берёт блокировку записи сразу: прочитанное внутри
+        # не изменится другим процессом до COMMIT.
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+
+class SQLiteCache(SQLiteFile, BaseCache):
+    """Кеш в файле SQLite, общий для всех процессов на машине.
+
+    Журнал WAL даёт читать параллельно с записью, внешний сервис
+    не нужен. Записей не больше `MAX_ENTRIES`: лишние вытесняются
+    по давности последнего чтения (LRU). Время чтения обновляется
+    не чаще раза в `LRU_RESOLUTION` секунд, чтобы чтение почти
+    никогда не становилось записью. Число записей считается в среднем
+    раз на `CULL_EVERY` записей, а не на каждую. `add` и `incr` атомарны между
+    процессами, на них держатся блокировки и счётчики поколений.
+    """
+    schema = SCHEMA
+
+    def __init__(self, location, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+        SQLiteFile.__init__(
+            self, location, float(options.get('BUSY_TIMEOUT', 5))
+        )
+        self._lru_resolution = int(options.get('LRU_RESOLUTION', 60))
+        self._cull_every = int(options.get('CULL_EVERY', 100))
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _row(self, db, key, now):
+        row = db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return row
+
+    def _touch_accessed(self, db, keys, now):
+        db.executemany(
+            'UPDATE cache SET accessed = ? WHERE key = ?',
+            [(now, key) for key in keys],
+        )
+
+    def get_expiring(self, key, version=None):
+        """Значение и срок записи по time.time(); None, если её нет."""
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        row = self._row(db, key, now)
+        if row is None:
+            return None
+        if row[2] < now - self._lru_resolution:
+            self._touch_accessed(db, [key], now)
+        return pickle.loads(row[0]), row[1]
+
+    def get(self, key, default=None, version=None):
+        entry = self.get_expiring(key, version)
+        return default if entry is None else entry[0]
+
+    def get_many_expiring(self, keys, version=None):
+        """Как `get_expiring`, но для многих ключей сразу."""
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        db = self._db
+        found = {}
+        stale = []
+        for chunk in chunks(keys):
+            rows = db.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                'WHERE key IN ({}) '
+                'AND (expires IS NULL OR expires > ?)'.format(
+                    ', '.join('?' * len(chunk))
+                ),
+                chunk + [now],
+            )
+            for key, value, expires, accessed in rows:
+                found[keys[key]] = (pickle.loads(value), expires)
+                if accessed < now - self._lru_resolution:
+                    stale.append(key)
+        if stale:
+            self._touch_accessed(db, stale, now)
+        return found
+
+    def get_many(self, keys, version=None):
+        found = self.get_many_expiring(keys, version)
+        return {key: value for key, (value, _) in found.items()}
+
+    def _write(self, db, mode, key, value, timeout):
+        now = time.time()
+        cursor = db.execute(
+            f'INSERT OR {mode} INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                key,
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                self.get_backend_timeout(timeout),
+                now,
+            ),
+        )
+        return cursor.rowcount == 1
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            self._write(db, 'REPLACE', key, value, timeout)
+            self._cull(db, 1)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._transaction() as db:
+            for key, value in data.items():
+                key = self._key(key, version)
+                self._write(db, 'REPLACE', key, value, timeout)
+            self._cull(db, len(data))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = self._write(db, 'IGNORE', key, value, timeout)
+            if added:
+                self._cull(db, 1)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            row = self._row(db, key, time.time())
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._row(self._db, key, time.time()) is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as db:
+            for chunk in chunks(keys):
+                db.execute(
+                    'DELETE FROM cache WHERE key IN ({})'.format(
+                        ', '.join('?' * len(chunk))
+                    ),
+                    chunk,
+                )
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _cull(self, db, writes):
+        """Вытесняет просроченные, а затем давно не читанные записи.
+
+        COUNT(*) проходит всю таблицу, поэтому после `writes` записей
+        он выполняется с вероятностью writes / CULL_EVERY: кеш может
+        ненадолго превысить MAX_ENTRIES на несколько записей.
+        """
+        if random.randrange(self._cull_every) >= writes:
+            return
+        (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,),
+        )
+
+    def close(self, **kwargs):
+        # Django закрывает кеши после каждого запроса; соединение
+        # с файлом дешевле держать открытым, как это делает locmem.
+        pass
+
+
+class InvalidationLog(SQLiteFile):
+    """Журнал изменённых ключей, общий для процессов на машине.
+
+    Каждая запись в L2 добавляет сюда ключ, и процессы, читая хвост
+    журнала, выбрасывают эти ключи из своего L1. Журнал держит
+    последние `size` записей; отставший сильнее процесс очищает L1.
+    """
+    schema = INVALIDATIONS_SCHEMA
+
+    def __init__(self, path, size):
+        super().__init__(path)
+        self.size = size
+
+    def publish(self, keys):
+        with self._transaction() as db:
+            db.executemany(
+                'INSERT INTO invalidations (key) VALUES (?)',
+                [(key,) for key in keys],
+            )
+            # lastrowid после executemany пуст, а last_insert_rowid()
+            # соединения — номер последней вставленной строки.
+            (last,) = db.execute('SELECT last_insert_rowid()').fetchone()
+            if last and last % self.size < len(keys):
+                db.execute(
+                    'DELETE FROM invalidations WHERE seq <= ?',
+                    (last - self.size,),
+                )
+
+    def last_seq(self):
+        (seq,) = self._db.execute(
+            'SELECT MAX(seq) FROM invalidations'
+        ).fetchone()
+        return seq or 0
+
+    def since(self, seq):
+        return self._db.execute(
+            'SELECT seq, key FROM invalidations WHERE seq > ? ORDER BY seq',
+            (seq,),
+        ).fetchall()
+
+
+class LocalTier:
+    """L1 процесса: LRU из сериализованных значений со сроком жизни.
+
+    Срок хранится абсолютным, по time.time(), как и в L2.
+    """
+
+    def __init__(self, log):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.log = log
+        # Журнал читается при первой сверке, а не при создании кеша:
+        # создать кеш ещё не значит открыть файл.
+        self.seq = None
+
+    def sync(self):
+        """Выбрасывает ключи, изменённые с прошлой сверки.
+
+        Это одно чтение индекса в журнале без десериализации значений,
+        обычно с пустым ответом.
+        """
+        with self.lock:
+            if self.seq is None:
+                self.seq = self.log.last_seq()
+            seq = self.seq
+        rows = self.log.since(seq)
+        if not rows:
+            return
+        with self.lock:
+            if rows[0][0] != seq + 1 or any(
+                key == EVERYTHING for _, key in rows
+            ):
+                self.entries.clear()
+            else:
+                for _, key in rows:
+                    self.entries.pop(key, None)
+            self.seq = max(self.seq, rows[-1][0])
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISS
+            value, expires = entry
+            if expires <= time.time():
+                del self.entries[key]
+                return _MISS
+            self.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, expires, max_entries):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+@receiver(request_started)
+def sync_tiers(**kwargs):
+    """Сверяет L1 кешей из CACHES с журналом в начале каждого запроса."""
+    for alias, params in settings.CACHES.items():
+        if params['BACKEND'] == f'{__name__}.TieredCache':
+            caches[alias]._l1.sync()
+
+
+class TieredCache(BaseCache):
+    """Маленький LRU в памяти процесса (L1) перед общим кешем (L2).
+
+    L2 — алиас из CACHES в OPTIONS['L2'], LOCATION — файл журнала
+    инвалидаций. Горячие ключи (первая страница ленты, популярные
+    посты) читаются из L1 без обращения к L2 и к журналу.
+
+    Чтения согласованы в пределах запроса: процесс сверяется
+    с журналом в начале запроса (request_started) и после своих
+    записей. Значение, изменённое другим процессом посреди запроса,
+    из L1 может отдаваться до его конца; свои записи видны сразу.
+    Вне запросов (команды, фоновые потоки) L1 сверяется только после
+    своих записей, и чужое значение живёт в нём не дольше
+    `L1_TIMEOUT`. L2 отдаёт
+    значение вместе со сроком записи (`get_expiring`, как у
+    `SQLiteCache`), и в L1 оно живёт до этого срока, но не дольше
+    `L1_TIMEOUT`.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options['L2']
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        with _tiers_lock:
+            if location not in _tiers:
+                _tiers[location] = LocalTier(InvalidationLog(
+                    location, int(options.get('LOG_SIZE', 10000))
+                ))
+            self._l1 = _tiers[location]
+
+    @property
+    def _l2(self):
+        return caches[self._l2_alias]
+
+    def _full_key(self, key, version):
+        return self._l2.make_key(key, version=version)
+
+    def _l1_expires(self, expires):
+        limit = time.time() + self._l1_timeout
+        return limit if expires is None else min(limit, expires)
+
+    def _invalidate(self, *keys):
+        self._l1.log.publish(keys)
+        self._l1.sync()
+
+    def get(self, key, default=None, version=None):
+        full_key = self._full_key(key, version)
+        value = self._l1.get(full_key)
+        if value is not _MISS:
+            return value
+        entry = self._l2.get_expiring(key, version=version)
+        if entry is None:
+            return default
+        value, expires = entry
+        self._l1.set(
+            full_key, value, self._l1_expires(expires), self._max_entries
+        )
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._l1.get(self._full_key(key, version))
+            if value is _MISS:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            fetched = self._l2.get_many_expiring(missing, version=version)
+            for key, (value, expires) in fetched.items():
+                self._l1.set(
+                    self._full_key(key, version),
+                    value,
+                    self._l1_expires(expires),
+                    self._max_entries,
+                )
+                found[key] = value
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISS, version=version) is not _MISS
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version=version)
+        self._invalidate(self._full_key(key, version))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._l2.set_many(data, timeout, version=version)
+        self._invalidate(*(self._full_key(key, version) for key in data))
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._l2.add(key, value, timeout, version=version)
+        if added:
+            self._invalidate(self._full_key(key, version))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self._l2.touch(key, timeout, version=version)
+        # Срок в L1 взят из L2 при чтении и после touch устарел.
+        self._invalidate(self._full_key(key, version))
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        value = self._l2.incr(key, delta, version=version)
+        self._invalidate(self._full_key(key, version))
+        return value
+
+    def delete(self, key, version=None):
+        deleted = self._l2.delete(key, version=version)
+        self._invalidate(self._full_key(key, version))
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._l2.delete_many(keys, version=version)
+        self._invalidate(*(self._full_key(key, version) for key in keys))
+
+    def clear(self):
+        self._l2.clear()
+        self._invalidate(EVERYTHING)
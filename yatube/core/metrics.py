@@ -0,0 +1,308 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf
+)
+
+_lock = threading.Lock()
+# (семейство, имя сэмпла, метки) -> значение. Все сэмплы и счётчиков,
+# и гистограмм только растут, поэтому процессы сводятся суммой.
+_samples = defaultdict(float)
+_families = {}
+_last_flush = 0
+# Сэмплы умерших процессов, слитые в один файл.
+ARCHIVE = 'archive.json'
+
+logger = logging.getLogger(__name__)
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        _families[name] = self
+
+    def inc(self, amount=1, **labels):
+        with _lock:
+            _samples[self.name, self.name + '_total', label_key(labels)] += (
+                amount
+            )
+        maybe_flush()
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        _families[name] = self
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        with _lock:
+            for bound in self.buckets:
+                if value <= bound:
+                    le = '+Inf' if bound == math.inf else repr(float(bound))
+                    _samples[
+                        self.name, self.name + '_bucket', key + (('le', le),)
+                    ] += 1
+            _samples[self.name, self.name + '_sum', key] += value
+            _samples[self.name, self.name + '_count', key] += 1
+        maybe_flush()
+
+
+def path(pid=None):
+    return os.path.join(settings.METRICS_DIR, f'{pid or os.getpid()}.json')
+
+
+def file_pid(name):
+    """pid процесса, записавшего файл `<pid>.json` или `<pid>.*.tmp`."""
+    try:
+        return int(os.path.basename(name).split('.', 1)[0])
+    except ValueError:
+        return None
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove(name):
+    try:
+        os.remove(name)
+    except OSError:
+        pass
+
+
+def read(name):
+    """Сэмплы из файла процесса; пусто, если файл не читается."""
+    try:
+        with open(name) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+def write(name, samples):
+    """Пишет сэмплы через временный файл: читатель не увидит половину.
+
+    Временный файл назван pid процесса, и если процесс умрёт посреди
+    записи, файл уберёт сбор метрик.
+    """
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(
+        prefix=f'{os.getpid()}.', suffix='.tmp', dir=settings.METRICS_DIR,
+    )
+    try:
+        with open(descriptor, 'w') as file:
+            json.dump(
+                [
+                    [family, sample, labels, value]
+                    for (family, sample, labels), value in samples.items()
+                ],
+                file,
+            )
+        os.replace(temporary, name)
+    except OSError:
+        remove(temporary)
+        raise
+
+
+def flush():
+    """Пишет сэмплы процесса в `METRICS_DIR/<pid>.json` атомарно.
+
+    Пишет под блокировкой: два потока процесса не обгонят друг друга
+    со старым снимком. Ошибка записи только попадает в лог — метрики
+    не должны ронять запрос.
+    """
+    global _last_flush
+    if not settings.METRICS_DIR:
+        return
+    with _lock:
+        _last_flush = time.monotonic()
+        try:
+            write(path(), _samples)
+        except OSError:
+            logger.exception('Не удалось записать метрики процесса')
+
+
+def maybe_flush():
+    # Запись на каждый запрос дорога: файл обновляется не чаще раза
+    # в METRICS_FLUSH_INTERVAL секунд.
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+atexit.register(flush)
+
+
+def add(total, name):
+    for family, sample, labels, value in read(name):
+        key = tuple(tuple(label) for label in labels)
+        total[family, sample, key] += value
+
+
+@contextmanager
+def locked(operation):
+    """Блокировка METRICS_DIR между процессами.
+
+    Слияние в архив берёт её на запись, сбор — на чтение: сбор не
+    посчитает сэмплы умершего процесса дважды и не потеряет их
+    посреди слияния.
+    """
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    with open(os.path.join(settings.METRICS_DIR, 'archive.lock'), 'a') as file:
+        fcntl.flock(file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def archive_dead():
+    """Сливает файлы умерших процессов в ARCHIVE и удаляет их.
+
+    Счётчики после смерти процесса не уменьшаются: так же поступает
+    multiprocess-режим prometheus_client. Брошенные `.tmp` просто
+    удаляются.
+    """
+    dead = [
+        name for name in glob.glob(os.path.join(settings.METRICS_DIR, '*'))
+        if file_pid(name) not in (None, os.getpid())
+        and not is_alive(file_pid(name))
+    ]
+    if not dead:
+        return
+    archive = os.path.join(settings.METRICS_DIR, ARCHIVE)
+    with locked(fcntl.LOCK_EX):
+        total = defaultdict(float)
+        add(total, archive)
+        for name in dead:
+            if name.endswith('.json'):
+                # Файл, который уже слил другой процесс, читается пустым.
+                add(total, name)
+        try:
+            write(archive, total)
+        except OSError:
+            logger.exception('Не удалось записать архив метрик')
+            return
+        for name in dead:
+            remove(name)
+
+
+def collect():
+    """Сэмплы всех процессов, сложенные по ключу.
+
+    Свои сэмплы берутся из памяти, без записи файла на каждый сбор.
+    Сэмплы умерших процессов лежат в ARCHIVE и тоже входят в сумму.
+    """
+    with _lock:
+        total = defaultdict(float, _samples)
+    if not settings.METRICS_DIR:
+        return total
+    archive_dead()
+    with locked(fcntl.LOCK_SH):
+        for name in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            if file_pid(name) != os.getpid():
+                add(total, name)
+    return total
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name,
+            value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        )
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def sort_key(sample):
+    name, labels, value = sample
+    le = dict(labels).get('le')
+    return (
+        name,
+        [label for label in labels if label[0] != 'le'],
+        float(le) if le else 0,
+    )
+
+
+def render():
+    """Метрики в текстовом формате Prometheus."""
+    by_family = defaultdict(list)
+    for (family, sample, labels), value in collect().items():
+        by_family[family].append((sample, labels, value))
+    lines = []
+    for name in sorted(by_family):
+        family = _families.get(name)
+        if family is not None:
+            lines.append(f'# HELP {name} {family.documentation}')
+            lines.append(f'# TYPE {name} {family.type}')
+        for sample, labels, value in sorted(by_family[name], key=sort_key):
+            lines.append(f'{sample}{format_labels(labels)} {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUESTS = Counter('yatube_requests', 'Ответы по view и коду статуса.')
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds', 'Время ответа view.'
+)
+SQL_QUERIES = Counter('yatube_sql_queries', 'Запросы к базе по view.')
+SQL_SECONDS = Histogram(
+    'yatube_sql_duration_seconds', 'Суммарное время SQL за запрос по view.'
+)
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests',
+    'Чтения кеша default по view: result="hit" или "miss".',
+)
+THUMBNAILS = Counter(
+    'yatube_thumbnails',
+    'Сборки миниатюр и вариантов картинки: result="built" или "error".',
+)
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_duration_seconds', 'Время сборки миниатюр поста.'
+)
+THUMBNAIL_LOOKUPS = Counter(
+    'yatube_thumbnail_lookups',
+    'Миниатюры на страницах: result="ready" или "missing".',
+)
+TEMPLATE_SECONDS = Histogram(
+    'yatube_template_render_seconds',
+    'Время рендера шаблона вместе с вложенными, по имени шаблона.',
+)
+INCLUDE_SECONDS = Histogram(
+    'yatube_include_render_seconds',
+    'Время {% include %} по месту вызова: origin — кто включает, '
+    'template — что.',
+)
@@ -0,0 +1,76 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+from .profiling import Profile, count_cache
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """Профилирует случайную долю запросов, `PROFILING_SAMPLE_RATE`.
+
+    Для остальных запросов цена — один вызов `random()`, поэтому
+    middleware можно не выключать под нагрузкой. Замеры и стеки
+    выбранных запросов пишутся в `PROFILING_DIR`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        with Profile(settings.PROFILING_INTERVAL).record() as profile:
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        try:
+            summary = profile.save(settings.PROFILING_DIR, view)
+        except OSError:
+            logger.exception('Не удалось сохранить профиль %s', view)
+        else:
+            logger.info('Профиль запроса: %s', summary)
+        return response
+
+
+class MetricsMiddleware:
+    """Время ответа, SQL и чтения кеша каждого запроса — в `core.metrics`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql = [0, 0]
+        cache = [0, 0]
+
+        def time_query(execute, *args):
+            start = time.perf_counter()
+            try:
+                return execute(*args)
+            finally:
+                sql[0] += 1
+                sql[1] += time.perf_counter() - start
+
+        def count_cache_reads(hits, misses):
+            cache[0] += hits
+            cache[1] += misses
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(time_query):
+            with count_cache(count_cache_reads):
+                response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.REQUESTS.inc(view=view, status=response.status_code)
+        metrics.REQUEST_SECONDS.observe(elapsed, view=view)
+        metrics.SQL_QUERIES.inc(sql[0], view=view)
+        metrics.SQL_SECONDS.observe(sql[1], view=view)
+        metrics.CACHE_REQUESTS.inc(cache[0], view=view, result='hit')
+        metrics.CACHE_REQUESTS.inc(cache[1], view=view, result='miss')
+        return response
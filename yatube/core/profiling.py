@@ -0,0 +1,255 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.db import connection
+from django.template import engine
+from django.template.backends import django as django_backend
+
+from .metrics import TEMPLATE_SECONDS
+
+_local = threading.local()
+_MISS = object()
+
+
+def current():
+    """Профиль запроса, который сейчас идёт в этом потоке, или None."""
+    return getattr(_local, 'profile', None)
+
+
+def fold(frame):
+    """Стек кадра в свёрнутом виде: `внешний;...;внутренний`."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f'{code.co_name} ({os.path.basename(code.co_filename)}'
+            f':{code.co_firstlineno})'
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+@contextmanager
+def count_cache(count):
+    """Сообщает `count(hits, misses)` о каждом чтении кеша по умолчанию.
+
+    Объекты кешей у каждого потока свои, поэтому обёртки ставятся
+    на объект этого потока и другие запросы не задевают. Вложенные
+    обёртки (профиль внутри метрик) снимаются в обратном порядке.
+    """
+    cache = caches['default']
+    own = {
+        name: cache.__dict__[name]
+        for name in ('get', 'get_many') if name in cache.__dict__
+    }
+    get, get_many = cache.get, cache.get_many
+
+    def counted_get(key, default=None, version=None):
+        value = get(key, _MISS, version=version)
+        if value is _MISS:
+            count(0, 1)
+            return default
+        count(1, 0)
+        return value
+
+    def counted_get_many(keys, version=None):
+        keys = list(keys)
+        values = get_many(keys, version=version)
+        count(len(values), len(keys) - len(values))
+        return values
+
+    cache.get, cache.get_many = counted_get, counted_get_many
+    try:
+        yield
+    finally:
+        del cache.get, cache.get_many
+        for name, method in own.items():
+            setattr(cache, name, method)
+
+
+def timings(counters):
+    return {
+        name: {'count': count, 'ms': round(seconds * 1000, 3)}
+        for name, (count, seconds) in counters.items()
+    }
+
+
+class StackSampler(threading.Thread):
+    """Раз в `interval` секунд снимает стек потока запроса.
+
+    Сам запрос не замедляется трассировкой каждого вызова, как
+    в cProfile: стоимость — одно чтение стека на интервал.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[fold(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profile:
+    """Замеры одного запроса: время, SQL, шаблоны, кеш и стеки."""
+
+    def __init__(self, interval):
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.sql_count = 0
+        self.sql_time = 0
+        self.render_time = 0
+        self.render_depth = 0
+        # Имя шаблона или `откуда > что` для include: [вызовы, секунды].
+        self.templates = defaultdict(lambda: [0, 0])
+        self.includes = defaultdict(lambda: [0, 0])
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @contextmanager
+    def record(self):
+        _local.profile = self
+        start = time.perf_counter()
+        self.sampler.start()
+        try:
+            with connection.execute_wrapper(self.time_query):
+                with count_cache(self.count_cache_reads):
+                    yield self
+        finally:
+            self.wall_time = time.perf_counter() - start
+            self.sampler.stop()
+            _local.profile = None
+
+    def time_query(self, execute, *args):
+        start = time.perf_counter()
+        try:
+            return execute(*args)
+        finally:
+            self.sql_count += 1
+            self.sql_time += time.perf_counter() - start
+
+    def count_cache_reads(self, hits, misses):
+        self.cache_hits += hits
+        self.cache_misses += misses
+
+    @contextmanager
+    def time_template(self, name):
+        """Время рендера шаблона, вложенные шаблоны входят в него."""
+        self.render_depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.render_depth -= 1
+            # Вложенные шаблоны уже вошли во время внешнего.
+            if not self.render_depth:
+                self.render_time += elapsed
+            self.templates[name][0] += 1
+            self.templates[name][1] += elapsed
+
+    @contextmanager
+    def time_include(self, origin, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            include = self.includes[f'{origin} > {name}']
+            include[0] += 1
+            include[1] += time.perf_counter() - start
+
+    def summary(self, view):
+        return {
+            'view': view,
+            'wall_ms': round(self.wall_time * 1000, 3),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'render_ms': round(self.render_time * 1000, 3),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'samples': sum(self.sampler.stacks.values()),
+            'templates': timings(self.templates),
+            'includes': timings(self.includes),
+        }
+
+    def save(self, directory, view):
+        """Пишет стеки в `<время>-<view>-<id>.folded` и строку в журнал.
+
+        Свёрнутый формат читают flamegraph.pl и speedscope.
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = '{}-{}-{}.folded'.format(
+            time.strftime('%Y%m%dT%H%M%S'),
+            view.replace(':', '.'),
+            uuid.uuid4().hex[:8],
+        )
+        with open(os.path.join(directory, name), 'w') as file:
+            for stack, count in self.sampler.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+        summary = dict(self.summary(view), stacks=name)
+        with open(os.path.join(directory, 'requests.jsonl'), 'a') as file:
+            file.write(json.dumps(summary) + '\n')
+        return summary
+
+
+class TimedTemplate:
+    """Шаблон, который пишет время своего рендера в метрики.
+
+    В запросе, попавшем в выборку профилирования, время уходит
+    ещё и в его профиль.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context):
+        name = self.template.name
+        profile = current()
+        start = time.perf_counter()
+        try:
+            if profile is None:
+                return self.template.render(context)
+            with profile.time_template(name):
+                return self.template.render(context)
+        finally:
+            TEMPLATE_SECONDS.observe(
+                time.perf_counter() - start, template=name
+            )
+
+
+class Engine(engine.Engine):
+    def get_template(self, template_name):
+        # Через get_template идут и страницы, и include, и inclusion-теги.
+        return TimedTemplate(super().get_template(template_name))
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Шаблонизатор Django, который замеряет время рендера шаблонов.
+
+    Время `{% include %}` по месту вызова считает тег из
+    `core.templatetags.profiling`, подключённый в builtins.
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        # Движок собран родителем из OPTIONS; подмена класса добавляет
+        # только get_template и не трогает его состояние.
+        self.engine.__class__ = Engine
@@ -0,0 +1,39 @@
+import time
+
+from django import template
+from django.template.loader_tags import IncludeNode, do_include
+
+from ..metrics import INCLUDE_SECONDS
+from ..profiling import current
+
+register = template.Library()
+
+
+class ProfiledIncludeNode(IncludeNode):
+    """`{% include %}`, который считает время по месту вызова."""
+
+    def render(self, context):
+        # Для `{% include some_var %}` в ключ попадает имя переменной.
+        name = str(self.template.var)
+        origin = self.origin.template_name if self.origin else None
+        profile = current()
+        start = time.perf_counter()
+        try:
+            if profile is None:
+                return super().render(context)
+            with profile.time_include(origin, name):
+                return super().render(context)
+        finally:
+            INCLUDE_SECONDS.observe(
+                time.perf_counter() - start, origin=origin, template=name
+            )
+
+
+@register.tag('include')
+def do_profiled_include(parser, token):
+    node = do_include(parser, token)
+    return ProfiledIncludeNode(
+        node.template,
+        extra_context=node.extra_context,
+        isolated_context=node.isolated_context,
+    )
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class isolated_files(override_settings):
+    """Файлы, которые пишут тесты, — во временном каталоге.
+
+    Картинки постов не попадают в настоящий MEDIA_ROOT, а кеш и журнал
+    событий начинаются с пустых файлов: база тестов каждый раз новая,
+    и записи прошлых запусков не должны ожить. Каталог удаляется,
+    когда настройки возвращаются.
+    """
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='yatube-test-')
+        super().__init__(
+            MEDIA_ROOT=os.path.join(self.directory, 'media'),
+            CACHES={
+                alias: dict(cache, LOCATION=self.path(cache['LOCATION']))
+                for alias, cache in settings.CACHES.items()
+            },
+            EVENTS_LOCATION=self.path(settings.EVENTS_LOCATION),
+        )
+
+    def path(self, location):
+        return os.path.join(self.directory, os.path.basename(location))
+
+    def disable(self):
+        super().disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """`manage.py test` с файлами тестов во временном каталоге."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.isolated_files = isolated_files()
+        self.isolated_files.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated_files.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,6 +1,31 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 from http import HTTPStatus
+from multiprocessing import get_context
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.signals import request_started
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from . import metrics
+from .asgi import ASGIHandler
+from .cache import InvalidationLog, SQLiteCache, TieredCache
+
+User = get_user_model()
+
+TEMP_PROFILING_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_METRICS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +33,548 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertTemplateUsed(response, 'core/404.html')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND.value)
+
+
+@override_settings(
+    PROFILING_DIR=TEMP_PROFILING_DIR,
+    PROFILING_SAMPLE_RATE=1,
+    PROFILING_INTERVAL=0.001,
+)
+class ProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_PROFILING_DIR, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_PROFILING_DIR, ignore_errors=True)
+        cache.clear()
+
+    def profiles(self):
+        path = os.path.join(TEMP_PROFILING_DIR, 'requests.jsonl')
+        with open(path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_sampled_request_is_profiled(self):
+        """Профиль содержит SQL, рендер, кеш и файл со стеками"""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        first, second = self.profiles()
+        self.assertEqual(first['view'], 'posts:index')
+        self.assertGreater(first['sql_count'], 0)
+        self.assertGreater(first['render_ms'], 0)
+        self.assertGreaterEqual(first['wall_ms'], first['render_ms'])
+        self.assertGreater(first['cache_misses'], 0)
+        self.assertGreater(second['cache_hits'], 0)
+        with open(os.path.join(TEMP_PROFILING_DIR, first['stacks'])) as file:
+            for line in file:
+                stack, count = line.rsplit(' ', 1)
+                self.assertIn('(', stack)
+                self.assertGreater(int(count), 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_profiled(self):
+        """Запросы вне выборки не оставляют следов"""
+        self.client.get(reverse('posts:index'))
+        self.assertFalse(os.path.exists(TEMP_PROFILING_DIR))
+
+    def test_templates_and_includes_are_timed(self):
+        """Время и число вызовов считаются по шаблонам и по include"""
+        author = User.objects.create_user(username='Ted')
+        for text in ('Первый', 'Второй'):
+            Post.objects.create(author=author, text=text)
+        self.client.get(reverse('posts:index'))
+        profile, = self.profiles()
+        templates = profile['templates']
+        self.assertEqual(templates['posts/index.html']['count'], 1)
+        self.assertEqual(templates['includes/header.html']['count'], 1)
+        self.assertGreaterEqual(
+            templates['posts/index.html']['ms'],
+            templates['includes/header.html']['ms'],
+        )
+        self.assertIn(
+            'base.html > includes/header.html', profile['includes']
+        )
+        self.assertEqual(
+            profile['includes']['posts/index.html > includes/article.html'][
+                'count'
+            ],
+            2,
+        )
+        self.assertIn(
+            'posts/index.html > posts/includes/paginator.html',
+            profile['includes'],
+        )
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def sample(self, name):
+        """Значение сэмпла со страницы метрик, 0 — если его ещё нет."""
+        response = self.client.get(reverse('metrics'))
+        for line in response.content.decode().splitlines():
+            if line.startswith(name + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_view_cache_and_sql_metrics(self):
+        """Запрос к странице виден в счётчиках view, SQL и кеша"""
+        requests = (
+            'yatube_requests_total{status="200",view="posts:index"}'
+        )
+        misses = (
+            'yatube_cache_requests_total{result="miss",view="posts:index"}'
+        )
+        queries = 'yatube_sql_queries_total{view="posts:index"}'
+        before = [self.sample(name) for name in (requests, misses, queries)]
+        self.client.get(reverse('posts:index'))
+        after = [self.sample(name) for name in (requests, misses, queries)]
+        self.assertEqual(after[0] - before[0], 1)
+        self.assertGreater(after[1], before[1])
+        self.assertGreater(after[2], before[2])
+        response = self.client.get(reverse('metrics'))
+        self.assertIn(
+            '# TYPE yatube_request_duration_seconds histogram',
+            response.content.decode(),
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"}',
+            response.content.decode(),
+        )
+
+    def test_templates_and_includes_are_timed(self):
+        """Рендер шаблонов и include попадает в метрики без профиля"""
+        author = User.objects.create_user(username='Ted')
+        for text in ('Первый', 'Второй'):
+            Post.objects.create(author=author, text=text)
+        template = (
+            'yatube_template_render_seconds_count'
+            '{template="posts/index.html"}'
+        )
+        include = (
+            'yatube_include_render_seconds_count'
+            '{origin="posts/index.html",template="includes/article.html"}'
+        )
+        before = [self.sample(name) for name in (template, include)]
+        self.client.get(reverse('posts:index'))
+        after = [self.sample(name) for name in (template, include)]
+        self.assertEqual(after[0] - before[0], 1)
+        self.assertEqual(after[1] - before[1], 2)
+
+    @override_settings(METRICS_DIR=TEMP_METRICS_DIR)
+    def test_processes_are_summed(self):
+        """Сэмплы других процессов из METRICS_DIR складываются"""
+        name = 'yatube_thumbnails_total{result="error"}'
+        own = self.sample(name)
+        with open(metrics.path(pid=1), 'w') as file:
+            json.dump([[
+                'yatube_thumbnails',
+                'yatube_thumbnails_total',
+                [['result', 'error']],
+                2,
+            ]], file)
+        self.assertEqual(self.sample(name), own + 2)
+
+    @override_settings(METRICS_DIR=TEMP_METRICS_DIR)
+    def test_dead_processes_are_archived(self):
+        """Сэмплы умерших процессов уходят в архив и не пропадают"""
+        name = 'yatube_thumbnails_total{result="error"}'
+        own = self.sample(name)
+        # pid больше 2**22 ядро Linux не выдаёт.
+        for pid in (2 ** 22 + 1, 2 ** 22 + 2):
+            with open(metrics.path(pid=pid), 'w') as file:
+                json.dump([[
+                    'yatube_thumbnails',
+                    'yatube_thumbnails_total',
+                    [['result', 'error']],
+                    2,
+                ]], file)
+        abandoned = os.path.join(TEMP_METRICS_DIR, f'{2 ** 22 + 1}.x.tmp')
+        open(abandoned, 'w').close()
+        self.assertEqual(self.sample(name), own + 4)
+        self.assertEqual(self.sample(name), own + 4)
+        for pid in (2 ** 22 + 1, 2 ** 22 + 2):
+            self.assertFalse(os.path.exists(metrics.path(pid=pid)))
+        self.assertFalse(os.path.exists(abandoned))
+        self.assertTrue(
+            os.path.exists(os.path.join(TEMP_METRICS_DIR, metrics.ARCHIVE))
+        )
+
+    @override_settings(METRICS_DIR=TEMP_METRICS_DIR)
+    def test_flush_failure_does_not_fail_request(self):
+        """Ошибка записи метрик не роняет запрос"""
+        with mock.patch.object(
+            metrics.os, 'replace', side_effect=OSError
+        ), self.assertLogs('core.metrics'):
+            metrics.flush()
+        self.assertEqual(
+            [name for name in os.listdir(TEMP_METRICS_DIR)
+             if name.endswith('.tmp')],
+            [],
+        )
+        metrics.flush()
+        self.assertTrue(os.path.exists(metrics.path()))
+
+    def test_metrics_are_internal(self):
+        """Снаружи страница метрик не видна"""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='192.0.2.1'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.location = os.path.join(directory, 'cache.sqlite3')
+
+    def cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        """Запись, чтение, add, срок жизни и удаление"""
+        cache = self.cache()
+        cache.set('post', {'text': 'Привет'})
+        self.assertEqual(cache.get('post'), {'text': 'Привет'})
+        self.assertFalse(cache.add('post', 'другое'))
+        self.assertTrue(cache.add('lock', 1, 60))
+        self.assertEqual(
+            cache.get_many(['post', 'lock', 'missing']),
+            {'post': {'text': 'Привет'}, 'lock': 1},
+        )
+        cache.set('expired', 1, -1)
+        self.assertIsNone(cache.get('expired'))
+        self.assertTrue(cache.add('expired', 2))
+        cache.delete_many(['post', 'lock'])
+        self.assertFalse(cache.has_key('post'))
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_shared_between_processes(self):
+        """Другой процесс видит записи, incr атомарен между процессами"""
+        cache = self.cache()
+        cache.set('counter', 0, None)
+        processes = [
+            get_context('fork').Process(
+                target=increment, args=(self.location, 50)
+            )
+            for _ in range(2)
+        ]
+        for process in processes:
+            process.start()
+        increment(self.location, 50)
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(cache.get('counter'), 150)
+
+    def test_least_recently_used_are_culled(self):
+        """Сверх MAX_ENTRIES вытесняются давно не читанные записи"""
+        cache = self.cache(
+            MAX_ENTRIES=4,
+            CULL_FREQUENCY=2,
+            LRU_RESOLUTION=0,
+            CULL_EVERY=1,
+        )
+        for number in range(4):
+            cache.set(number, number)
+            time.sleep(0.01)
+        cache.get(0)
+        cache.get(1)
+        cache.set('new', 'new')
+        self.assertEqual(
+            cache.get_many([0, 1, 2, 3, 'new']),
+            {0: 0, 1: 1, 'new': 'new'},
+        )
+
+    def test_size_is_checked_now_and_then(self):
+        """Число записей считается не на каждую запись"""
+        cache = self.cache(MAX_ENTRIES=1, CULL_FREQUENCY=2, CULL_EVERY=1000)
+        with mock.patch('core.cache.random.randrange', return_value=999):
+            cache.set_many({number: number for number in range(3)})
+        self.assertEqual(len(cache.get_many(range(3))), 3)
+        with mock.patch('core.cache.random.randrange', return_value=0):
+            cache.set('new', 'new')
+        self.assertLessEqual(len(cache.get_many([0, 1, 2, 'new'])), 2)
+
+
+def tiered(location):
+    return TieredCache(location, {'OPTIONS': {'L2': 'shared'}})
+
+
+def write(location, method, *args):
+    getattr(tiered(location), method)(*args)
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.location = os.path.join(directory, 'invalidations.sqlite3')
+        # L1 общий у всех кешей с одним журналом: алиас в CACHES нужен,
+        # чтобы request_started сверял и L1 кешей этого теста.
+        override = override_settings(CACHES=dict(settings.CACHES, tiered={
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': self.location,
+            'OPTIONS': {'L2': 'shared'},
+        }))
+        override.enable()
+        self.addCleanup(override.disable)
+        caches['shared'].clear()
+
+    def in_other_process(self, method, *args):
+        process = get_context('fork').Process(
+            target=write, args=(self.location, method) + args
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+    def test_hot_keys_are_read_from_memory(self):
+        """Повторное чтение не обращается к общему кешу"""
+        cache = tiered(self.location)
+        cache.set('post', 'Привет')
+        self.assertEqual(cache.get('post'), 'Привет')
+        with mock.patch.object(
+            caches['shared'], 'get', side_effect=AssertionError
+        ), mock.patch.object(
+            caches['shared'], 'get_many', side_effect=AssertionError
+        ):
+            self.assertEqual(cache.get('post'), 'Привет')
+            self.assertEqual(cache.get_many(['post']), {'post': 'Привет'})
+
+    def test_reads_do_not_touch_the_log(self):
+        """Чтение из L1 не обращается к журналу, своя запись видна сразу"""
+        cache = tiered(self.location)
+        cache.set('post', 'Привет')
+        self.assertEqual(cache.get('post'), 'Привет')
+        with mock.patch.object(
+            InvalidationLog, 'since', side_effect=AssertionError
+        ):
+            self.assertEqual(cache.get('post'), 'Привет')
+            self.assertEqual(cache.get_many(['post']), {'post': 'Привет'})
+        cache.set('post', 'Пока')
+        self.assertEqual(cache.get('post'), 'Пока')
+
+    def test_writes_of_other_processes_are_seen(self):
+        """Запись и удаление в другом процессе выбрасывают ключ из L1"""
+        cache = tiered(self.location)
+        cache.set_many({'post': 'старый', 'group': 'cats'})
+        cache.set('counter', 1, None)
+        self.assertEqual(
+            cache.get_many(['post', 'group', 'counter']),
+            {'post': 'старый', 'group': 'cats', 'counter': 1},
+        )
+        self.in_other_process('set', 'post', 'новый')
+        self.in_other_process('delete', 'group')
+        self.in_other_process('incr', 'counter')
+        # До начала следующего запроса L1 отдаёт прежние значения.
+        self.assertEqual(cache.get('post'), 'старый')
+        request_started.send(sender=self.__class__)
+        self.assertEqual(cache.get('post'), 'новый')
+        self.assertIsNone(cache.get('group'))
+        self.assertEqual(cache.get('counter'), 2)
+
+    def test_clear_empties_every_process(self):
+        """clear в другом процессе очищает и L1 этого процесса"""
+        cache = tiered(self.location)
+        cache.set('post', 'Привет')
+        self.assertTrue(cache.has_key('post'))
+        self.in_other_process('clear')
+        request_started.send(sender=self.__class__)
+        self.assertFalse(cache.has_key('post'))
+
+    def test_short_timeout_is_kept_in_memory(self):
+        """Из L1 значение уходит вместе со сроком записи в L2"""
+        cache = tiered(self.location)
+        cache.set('lock', 1, 0.1)
+        cache.set_many({'short': 1}, 0.1)
+        self.assertEqual(cache.get('lock'), 1)
+        self.assertEqual(cache.get_many(['short']), {'short': 1})
+        time.sleep(0.15)
+        self.assertIsNone(cache.get('lock'))
+        self.assertEqual(cache.get_many(['short']), {})
+        self.assertFalse(cache.has_key('lock'))
+        self.assertTrue(cache.add('lock', 2))
+        self.assertEqual(cache.get('lock'), 2)
+
+    def test_invalidation_log_is_pruned(self):
+        """Журнал держит последние записи, и после пачки тоже"""
+        log = InvalidationLog(self.location, 2)
+        for key in 'abcd':
+            log.publish([key])
+        self.assertEqual(log.since(0), [(3, 'c'), (4, 'd')])
+        log.publish(['e', 'f', 'g'])
+        self.assertEqual(log.since(0), [(6, 'f'), (7, 'g')])
+
+
+class Echo:
+    """WSGI-приложение, которое отвечает тем, что получило."""
+
+    def __init__(self):
+        self.closed = False
+
+    def __call__(self, environ, start_response):
+        self.environ = environ
+        self.thread = threading.get_ident()
+        start_response(
+            '201 Created', [('X-Method', environ['REQUEST_METHOD'])]
+        )
+        return self
+
+    def __iter__(self):
+        yield self.environ['PATH_INFO'].encode('latin-1')
+        yield b''
+        yield self.environ['wsgi.input'].read(
+            int(self.environ['CONTENT_LENGTH'])
+        )
+
+    def close(self):
+        self.closed = True
+
+
+class Stream(Echo):
+    """Асинхронный ответ: одна часть, а дальше ждёт без конца."""
+
+    def __init__(self):
+        super().__init__()
+        self.finished = False
+
+    async def __aiter__(self):
+        try:
+            yield b'data: 1\n\n'
+            await asyncio.Event().wait()
+        finally:
+            self.finished = True
+
+
+class ASGIHandlerTest(SimpleTestCase):
+    def call(self, scope, messages, application=None, disconnect_after=None):
+        """Прогон запроса; клиент уходит, получив `disconnect_after` частей."""
+        messages = list(messages)
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            while disconnect_after is None or len(sent) < disconnect_after:
+                await asyncio.sleep(0.01)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        echo = application or Echo()
+        handler = ASGIHandler(echo, threads=1)
+        asyncio.run(handler(dict({'type': 'http'}, **scope), receive, send))
+        handler.executor.shutdown()
+        return echo, sent
+
+    def test_request_is_translated_to_wsgi(self):
+        """Путь, заголовки и тело из частей доходят до WSGI-приложения"""
+        echo, sent = self.call(
+            {
+                'method': 'POST',
+                'path': '/profile/кот/',
+                'query_string': b'page=2',
+                'headers': [
+                    (b'content-type', b'text/plain'),
+                    (b'accept', b'text/html'),
+                    (b'accept', b'*/*'),
+                ],
+                'client': ('192.0.2.1', 5000),
+            },
+            [
+                {'type': 'http.request', 'body': b'Hello, ',
+                 'more_body': True},
+                {'type': 'http.request', 'body': b'world'},
+            ],
+        )
+        self.assertEqual(echo.environ['QUERY_STRING'], 'page=2')
+        self.assertEqual(echo.environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(echo.environ['CONTENT_LENGTH'], '12')
+        self.assertEqual(echo.environ['HTTP_ACCEPT'], 'text/html,*/*')
+        self.assertEqual(echo.environ['REMOTE_ADDR'], '192.0.2.1')
+        self.assertEqual(sent[0], {
+            'type': 'http.response.start',
+            'status': 201,
+            'headers': [(b'x-method', b'POST')],
+        })
+        self.assertEqual(
+            b''.join(message['body'] for message in sent[1:]),
+            '/profile/кот/'.encode() + b'Hello, world',
+        )
+        self.assertFalse(sent[-1].get('more_body', False))
+        self.assertTrue(echo.closed)
+
+    def test_client_gone_before_body(self):
+        """Клиент ушёл, не дослав тело: view не вызывается"""
+        echo, sent = self.call(
+            {'method': 'POST', 'path': '/'},
+            [
+                {'type': 'http.request', 'body': b'x', 'more_body': True},
+                {'type': 'http.disconnect'},
+            ],
+        )
+        self.assertEqual(sent, [])
+        self.assertFalse(hasattr(echo, 'environ'))
+
+    def test_async_stream_stops_on_disconnect(self):
+        """Асинхронный поток отдаётся из цикла и прерывается уходом клиента"""
+        stream, sent = self.call(
+            {'method': 'GET', 'path': '/events/'},
+            [{'type': 'http.request'}],
+            application=Stream(),
+            disconnect_after=2,
+        )
+        self.assertEqual(sent[1]['body'], b'data: 1\n\n')
+        self.assertEqual(len(sent), 2)
+        self.assertTrue(stream.finished)
+        self.assertTrue(stream.closed)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=4, POST_IMAGE_MAX_SIZE=4)
+    def test_large_body_is_rejected(self):
+        """Тело больше предела получает 413, view не вызывается"""
+        for headers, messages in (
+            ([(b'content-length', b'9')], [{'type': 'http.request'}]),
+            ([], [
+                {'type': 'http.request', 'body': b'12345',
+                 'more_body': True},
+                {'type': 'http.request', 'body': b'6789',
+                 'more_body': True},
+            ]),
+        ):
+            with self.subTest(headers=headers):
+                echo, sent = self.call(
+                    {'method': 'POST', 'path': '/', 'headers': headers},
+                    messages,
+                )
+                self.assertEqual(sent[0]['status'], 413)
+                self.assertFalse(hasattr(echo, 'environ'))
+
+    def test_connections_are_closed_in_view_thread(self):
+        """Соединения с базой закрываются в потоке, где шёл view"""
+        threads = []
+        with mock.patch(
+            'core.asgi.close_old_connections',
+            side_effect=lambda: threads.append(threading.get_ident()),
+        ):
+            echo, sent = self.call(
+                {'method': 'GET', 'path': '/'}, [{'type': 'http.request'}]
+            )
+        self.assertIn(echo.thread, threads)
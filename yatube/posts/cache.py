@@ -0,0 +1,197 @@
+import math
+import random
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from .models import Follow
+
+POST_CARD_FRAGMENT = 'post_card'
+GENERATION_KEY = 'posts:generation:{}'
+FRAGMENT_KEY = 'posts:fragment:{}:{}:{}'
+FOLLOWING_KEY = 'posts:following:{}:{}'
+LOCK_KEY = '{}:lock'
+FEED = 'feed'
+# Группы видны в карточках любой ленты, меняются редко.
+GROUPS = 'groups'
+# Сколько ждать чужого пересчёта и сколько отдавать устаревшее значение.
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+EARLY_RECOMPUTE_BETA = 1.0
+
+
+def post_card_key(post):
+    """Ключ карточки из `includes/article.html`.
+
+    В ключ входят `updated_at` и то, что карточка показывает об авторе
+    и группе, поэтому изменённый пост или переименованный автор дают
+    новую запись, а старая больше не читается.
+    """
+    return make_template_fragment_key(POST_CARD_FRAGMENT, [
+        post.pk,
+        post.updated_at,
+        post.author.username,
+        post.author.get_full_name(),
+        post.group.slug if post.group_id else '',
+    ])
+
+
+def forget_post_card(post):
+    cache.delete(post_card_key(post))
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def initial_generation():
+    # Если счётчик вытеснили из кеша, новый начнётся с большего
+    # значения, и старые записи не оживут.
+    return time.time_ns() // 1000
+
+
+def generation(scope):
+    return generations([scope])[0]
+
+
+def generations(scopes):
+    """Поколения областей одним чтением кеша."""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, initial_generation(), None)
+        found.update(cache.get_many(missing))
+    return [found.get(key) for key in keys]
+
+
+def bump(*scopes):
+    """Сдвигает поколения: всё, что закешировано под ними, устаревает."""
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial_generation(), None)
+
+
+def followed_authors(user_id):
+    """Авторы, на которых подписан читатель; в кеше до смены подписок."""
+    key = FOLLOWING_KEY.format(user_id, generation(follow_scope(user_id)))
+    authors = cache.get(key)
+    if authors is None:
+        authors = list(Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True
+        ))
+        cache.set(key, authors, settings.POSTS_CACHE_TIMEOUT)
+    return authors
+
+
+def follow_scopes(user_id):
+    """Области ленты подписок читателя.
+
+    Запись поста сдвигает одно поколение — своего автора, а не ленты
+    всех его подписчиков: лента читателя сама сверяет поколения
+    авторов, на которых он подписан, при каждом запросе.
+    """
+    return [
+        follow_scope(user_id),
+        GROUPS,
+        *map(author_scope, followed_authors(user_id)),
+    ]
+
+
+def wait_for(key, lock):
+    """Ждёт, пока чужой пересчёт положит значение или отпустит блокировку."""
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(lock) is None:
+            # Значение могло появиться между двумя чтениями.
+            return cache.get(key)
+    return None
+
+
+def get_or_compute(key, compute, timeout, cacheable=None):
+    """Достаёт значение из кеша, защищая базу от «лавины» пересчётов.
+
+    Значение хранится вместе со временем вычисления и мягким сроком
+    жизни. Незадолго до срока запись с растущей вероятностью считается
+    протухшей (probabilistic early recomputation), и пересчитывает её
+    только тот, кто взял блокировку, — остальные получают прежнее
+    значение. Если значения нет совсем, остальные ждут победителя.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        jitter = -delta * EARLY_RECOMPUTE_BETA * math.log(
+            1 - random.random()
+        )
+        if time.time() + jitter < expires:
+            return value
+    lock = LOCK_KEY.format(key)
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry[0]
+        entry = wait_for(key, lock)
+        if entry is not None:
+            return entry[0]
+    else:
+        # Пока этот клиент шёл за блокировкой, другой мог успеть
+        # пересчитать значение и отпустить её.
+        fresh = cache.get(key)
+        if fresh is not None and fresh != entry and time.time() < fresh[2]:
+            cache.delete(lock)
+            return fresh[0]
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        if cacheable is None or cacheable(value):
+            # Запись живёт вдвое дольше мягкого срока, чтобы было что
+            # отдавать, пока один процесс её пересчитывает.
+            cache.set(
+                key, (value, delta, time.time() + timeout), timeout * 2
+            )
+        return value
+    finally:
+        if locked:
+            cache.delete(lock)
+
+
+def fragment_cached(request, name, scopes, vary_on=()):
+    """Есть ли в кеше кусок, который нарисует `{% cachefragment %}`."""
+    return cache.get(fragment_key(request, name, scopes, vary_on)) is not None
+
+
+def fragment_key(request, name, scopes, vary_on=()):
+    """Ключ куска страницы для `{% cachefragment %}`.
+
+    Кусок живёт до смены поколения любой из областей `scopes`; адрес
+    страницы и `vary_on` отделяют разные страницы и разных читателей.
+    Областей у ленты подписок сотни, поэтому поколения входят в ключ
+    хешем.
+    """
+    vary = ':'.join([request.get_full_path(), *map(str, vary_on)])
+    versions = '.'.join(map(str, generations(scopes)))
+    return FRAGMENT_KEY.format(
+        name,
+        md5(versions.encode()).hexdigest(),
+        md5(vary.encode()).hexdigest(),
+    )
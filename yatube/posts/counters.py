@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorCounter, Comment, Follow, Group, ImageBlob, Post
+
+
+def change(model, pk, field, delta):
+    """Атомарно сдвигает счётчик, не опуская его ниже нуля."""
+    if pk is None:
+        return 0
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_author(user_id, field, delta):
+    if not change(AuthorCounter, user_id, field, delta) and delta > 0:
+        AuthorCounter.objects.get_or_create(user_id=user_id)
+        change(AuthorCounter, user_id, field, delta)
+
+
+def change_image(name, delta):
+    """Сдвигает число постов, ссылающихся на файл картинки."""
+    if not name:
+        return
+    if not change(ImageBlob, name, 'references', delta) and delta > 0:
+        ImageBlob.objects.get_or_create(name=name)
+        change(ImageBlob, name, 'references', delta)
+
+
+def author_posts_count(user):
+    try:
+        return user.counter.posts_count
+    except AuthorCounter.DoesNotExist:
+        return 0
+
+
+def count_subquery(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def totals(queryset, field):
+    return queryset.order_by().values_list(field).annotate(total=Count('pk'))
+
+
+@transaction.atomic
+def rebuild():
+    """Пересчитывает счётчики постов, комментариев, подписок и картинок."""
+    Group.objects.update(posts_count=count_subquery(Post.objects, 'group'))
+    Post.objects.update(
+        comments_count=count_subquery(Comment.objects, 'post')
+    )
+    authors = {}
+    for user_id, total in totals(Post.objects, 'author'):
+        authors.setdefault(user_id, AuthorCounter(user_id=user_id))
+        authors[user_id].posts_count = total
+    for user_id, total in totals(Follow.objects, 'author'):
+        authors.setdefault(user_id, AuthorCounter(user_id=user_id))
+        authors[user_id].followers_count = total
+    AuthorCounter.objects.all().delete()
+    AuthorCounter.objects.bulk_create(authors.values(), batch_size=500)
+    # Строки без ссылок остаются: по ним видно, какие файлы не нужны.
+    ImageBlob.objects.update(references=0)
+    for name, total in totals(Post.objects.exclude(image=''), 'image'):
+        ImageBlob.objects.update_or_create(
+            name=name, defaults={'references': total}
+        )
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from core.asgi import ASGI_KEY
+from core.cache import SQLiteFile
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL
+);
+'''
+# Через сколько миллисекунд браузер переподключается после обрыва.
+RETRY_MS = 5000
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+class EventLog(SQLiteFile):
+    """Журнал новых постов, общий для процессов на машине."""
+    schema = SCHEMA
+
+    def __init__(self, path, size=10000):
+        super().__init__(path)
+        self.size = size
+
+    def publish(self, post_id, author_id):
+        with self._transaction() as db:
+            seq = db.execute(
+                'INSERT INTO events (post_id, author_id) VALUES (?, ?)',
+                (post_id, author_id),
+            ).lastrowid
+            if seq % self.size == 0:
+                db.execute(
+                    'DELETE FROM events WHERE seq <= ?', (seq - self.size,)
+                )
+
+    def last_seq(self):
+        (seq,) = self._db.execute('SELECT MAX(seq) FROM events').fetchone()
+        return seq or 0
+
+    def since(self, seq):
+        return self._db.execute(
+            'SELECT seq, post_id, author_id FROM events '
+            'WHERE seq > ? ORDER BY seq',
+            (seq,),
+        ).fetchall()
+
+
+class Subscription:
+    """События одного соединения под ASGI.
+
+    Их ждут в цикле событий: соединение не занимает поток, пока новых
+    постов нет.
+    """
+
+    def __init__(self, broker, seq):
+        self.broker = broker
+        self.seq = seq
+        self.rows = []
+        self.lock = threading.Lock()
+        self.loop = None
+        self.waiter = None
+
+    def push(self, rows):
+        with self.lock:
+            rows = [row for row in rows if row[0] > self.seq]
+            if not rows:
+                return
+            self.rows.extend(rows)
+            self.seq = rows[-1][0]
+            loop, waiter = self.loop, self.waiter
+        if waiter is not None:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def take(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+            if self.waiter is not None:
+                self.waiter.clear()
+        return rows
+
+    async def wait_async(self, timeout):
+        with self.lock:
+            if self.waiter is None:
+                self.loop = asyncio.get_running_loop()
+                self.waiter = asyncio.Event()
+                if self.rows:
+                    self.waiter.set()
+        try:
+            await asyncio.wait_for(self.waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.take()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """Раздаёт события журнала подпискам этого процесса.
+
+    Журнал читает один поток на процесс раз в `interval` секунд и только
+    пока есть подписки, поэтому тысяча открытых лент стоит столько же,
+    сколько одна.
+    """
+
+    def __init__(self, log, interval):
+        self.log = log
+        self.interval = interval
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.seq = 0
+
+    def subscribe(self, seq):
+        """Подписка на события после `seq`, пропущенные отдаются сразу."""
+        subscription = Subscription(self, seq)
+        with self.lock:
+            # Под блокировкой поток не прочитает журнал между догоняющим
+            # чтением и подпиской: ни одно событие не потеряется.
+            subscription.push(self.log.since(seq))
+            self.subscriptions.add(subscription)
+            if self.thread is None:
+                self.seq = self.log.last_seq()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.subscriptions:
+                    self.thread = None
+                    return
+                rows = self.log.since(self.seq)
+                if rows:
+                    self.seq = rows[-1][0]
+                    for subscription in self.subscriptions:
+                        subscription.push(rows)
+
+
+def broker():
+    location = settings.EVENTS_LOCATION
+    with _brokers_lock:
+        if location not in _brokers:
+            _brokers[location] = Broker(
+                EventLog(location), settings.EVENTS_POLL_INTERVAL
+            )
+        return _brokers[location]
+
+
+def enabled(request):
+    """Показывать ли плашку новых постов.
+
+    Её включает EVENTS_STREAM или сам ASGI-вход: под ним открытый поток
+    не занимает поток сервера.
+    """
+    return settings.EVENTS_STREAM or request.META.get(ASGI_KEY, False)
+
+
+def publish(post):
+    broker().log.publish(post.pk, post.author_id)
+
+
+def last_seq():
+    return broker().log.last_seq()
+
+
+class EventStream(StreamingHttpResponse):
+    """Поток `text/event-stream`: сколько вышло новых постов.
+
+    Событие `posts` несёт номер в журнале и прирост по лентам:
+    `index` — все посты, кроме своих, `follow` — посты авторов,
+    на которых подписан читатель. При переподключении браузер
+    присылает Last-Event-ID, и страница получает только новое.
+
+    Под ASGI события ждутся в цикле событий, а соединение закрывается
+    через `EVENTS_MAX_AGE` секунд. Под WSGI ответ короткий: накопленное
+    после `since` и конец, браузер переспрашивает через RETRY_MS —
+    воркер не ждёт новых постов.
+    """
+
+    def __init__(self, since, user_id=None, following=()):
+        self.since = since
+        self.user_id = user_id
+        self.following = set(following)
+        super().__init__(self.stream(), content_type='text/event-stream')
+        self['Cache-Control'] = 'no-cache'
+        self['X-Accel-Buffering'] = 'no'
+
+    def message(self, rows):
+        if not rows:
+            return b': ping\n\n'
+        data = {
+            'index': sum(row[2] != self.user_id for row in rows),
+            'follow': sum(row[2] in self.following for row in rows),
+        }
+        return (
+            f'id: {rows[-1][0]}\nevent: posts\ndata: {json.dumps(data)}\n\n'
+        ).encode()
+
+    def stream(self):
+        yield f'retry: {RETRY_MS}\n\n'.encode()
+        rows = broker().log.since(self.since)
+        if rows:
+            yield self.message(rows)
+
+    async def __aiter__(self):
+        yield f'retry: {RETRY_MS}\n\n'.encode()
+        subscription = broker().subscribe(self.since)
+        deadline = time.monotonic() + settings.EVENTS_MAX_AGE
+        try:
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                yield self.message(await subscription.wait_async(
+                    min(settings.EVENTS_HEARTBEAT, left)
+                ))
+        finally:
+            subscription.close()
@@ -0,0 +1,223 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import AuthorCounter, Follow, Post, TimelineEntry
+from .paginator import CursorPaginator
+
+BATCH_SIZE = 500
+# Поля поста, которые нужны карточке в ленте.
+CARD_FIELDS = (
+    'text',
+    'pub_date',
+    'updated_at',
+    'image',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group',
+    'group__slug',
+)
+
+
+def feed_posts(posts=None):
+    """Посты для ленты: автор и группа одним JOIN, только поля карточки.
+
+    Через неё идут все списки постов, чтобы шаблон карточки не ходил
+    в базу за автором и группой каждого поста.
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.select_related('author', 'group').only(*CARD_FIELDS)
+
+
+class TimelinePaginator(CursorPaginator):
+    """Листает `TimelineEntry` читателя, а на страницу отдаёт посты."""
+    keys = ('pub_date', 'post_id')
+
+    def fetch(self, position, backwards, limit):
+        entries = super().fetch(position, backwards, limit)
+        return [entry.post for entry in entries]
+
+
+class FollowFeedPaginator(TimelinePaginator):
+    """Гибридная лента подписок.
+
+    Посты обычных авторов берутся из готовой ленты читателя, посты
+    «звёзд» (`FEED_CELEBRITY_FOLLOWERS` подписчиков и больше) — прямо из
+    `Post` по индексу автора. Потоки сливаются по (pub_date, id), так что
+    страница остаётся упорядоченной, а курсоры — общими.
+    """
+
+    def __init__(self, object_list, per_page, celebrities=()):
+        super().__init__(object_list, per_page)
+        self.celebrities = celebrities
+
+    def fetch(self, position, backwards, limit):
+        streams = [super().fetch(position, backwards, limit)]
+        for author_id in self.celebrities:
+            posts = CursorPaginator(
+                feed_posts(Post.objects.filter(author_id=author_id)),
+                self.per_page,
+            )
+            streams.append(posts.fetch(position, backwards, limit))
+        merged = heapq.merge(
+            *streams,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=not backwards,
+        )
+        # Старые посты «звезды» могли остаться в ленте с тех пор,
+        # когда подписчиков было меньше порога.
+        posts = []
+        seen = set()
+        for post in merged:
+            if post.pk in seen:
+                continue
+            seen.add(post.pk)
+            posts.append(post)
+            if len(posts) == limit:
+                break
+        return posts
+
+
+def follow_feed(user):
+    """Лента подписок — один диапазон по индексу (user, pub_date, post)."""
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    ).only('pub_date', 'post', *(f'post__{field}' for field in CARD_FIELDS))
+
+
+def followed_celebrities(user):
+    """Авторы-«звёзды», на которых подписан читатель."""
+    return list(Follow.objects.filter(
+        user=user,
+        author__counter__followers_count__gte=(
+            settings.FEED_CELEBRITY_FOLLOWERS
+        ),
+    ).values_list('author_id', flat=True))
+
+
+def is_celebrity(author_id):
+    return AuthorCounter.objects.filter(
+        user_id=author_id,
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    ).exists()
+
+
+def insert_entries(entries):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора.
+
+    Посты «звёзд» не раскладываются: их читает `FollowFeedPaginator`.
+    """
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    )
+    insert_entries(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def author_entries(user_id, author_id):
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date'
+    )
+    for post_id, pub_date in posts.iterator():
+        yield TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+
+
+def insert_follows(follows):
+    """Кладёт в ленты все посты авторов из подписок `follows`.
+
+    Ленты собираются в базе одним INSERT ... SELECT (Follow JOIN Post)
+    на пачку из BATCH_SIZE подписок, а не запросом на каждую подписку.
+    """
+    insert = connection.ops.insert_statement(ignore_conflicts=True)
+    suffix = connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)
+    entry, follow, post = (
+        connection.ops.quote_name(model._meta.db_table)
+        for model in (TimelineEntry, Follow, Post)
+    )
+    ids = follows.order_by('pk').values_list('pk', flat=True).iterator()
+    while True:
+        batch = list(islice(ids, BATCH_SIZE))
+        if not batch:
+            return
+        sql, params = follows.filter(
+            pk__range=(batch[0], batch[-1])
+        ).values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{insert} {entry} (user_id, post_id, author_id, pub_date) '
+                f'SELECT f.user_id, p.id, p.author_id, p.pub_date '
+                f'FROM {follow} f JOIN {post} p ON p.author_id = f.author_id '
+                f'WHERE f.id IN ({sql}) {suffix}',
+                params,
+            )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя все посты нового автора."""
+    if not is_celebrity(author_id):
+        insert_entries(author_entries(user_id, author_id))
+
+
+def followers_changed(author_id, delta):
+    """Переносит автора между лентами, когда он пересекает порог «звезды».
+
+    Новую «звезду» читает `FollowFeedPaginator`, её записи из лент
+    убираются. Бывшая «звезда» раскладывается по лентам всех
+    подписчиков: её посты за «звёздное» время в них не попадали.
+    """
+    threshold = settings.FEED_CELEBRITY_FOLLOWERS
+    count = AuthorCounter.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if delta > 0 and count == threshold:
+        TimelineEntry.objects.filter(author_id=author_id).delete()
+    elif delta < 0 and count == threshold - 1:
+        insert_follows(Follow.objects.filter(author_id=author_id))
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты читателя посты автора, от которого он отписался."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild():
+    """Собирает все ленты заново по подпискам.
+
+    Нужна после смены `FEED_CELEBRITY_FOLLOWERS`: переход через порог
+    отдельного автора `followers_changed` обрабатывает сам.
+    """
+    TimelineEntry.objects.all().delete()
+    insert_follows(Follow.objects.exclude(
+        author__counter__followers_count__gte=(
+            settings.FEED_CELEBRITY_FOLLOWERS
+        ),
+    ))
@@ -3,7 +3,24 @@ from django import forms
 from .models import Post, Comment
 
 
-class PostForm(forms.ModelForm):
+class UploadErrorsMixin:
+    """Показывает ошибки, найденные обработчиком загрузки.
+
+    Отвергнутый файл не доходит до `request.FILES`, и без этого форма
+    молча сохранила бы пост без картинки.
+    """
+
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean(self):
+        for field, message in self.upload_errors.items():
+            self.add_error(field, message)
+        return super().clean()
+
+
+class PostForm(UploadErrorsMixin, forms.ModelForm):
     class Meta:
         model = Post
         labels = {
@@ -16,7 +33,7 @@ class PostForm(forms.ModelForm):
         fields = ['text', 'group', 'image']
 
 
-class PostFormEdit(forms.ModelForm):
+class PostFormEdit(UploadErrorsMixin, forms.ModelForm):
     class Meta:
         model = Post
         labels = {
@@ -0,0 +1,257 @@
+import asyncio
+import io
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+from core.asgi import ASGIHandler, build_environ
+from posts.models import Group, Post
+
+from .benchmark_views import (
+    PERCENTILES, POST_SAMPLE, REMOTE_ADDR, percentile, sample_pks,
+)
+
+User = get_user_model()
+
+# Чтения гостя: доли как в benchmark_views.
+READS = {
+    'index': 40,
+    'post_detail': 25,
+    'profile': 5,
+    'group_list': 4,
+}
+# Любой токен из 64 допустимых символов сходится сам с собой.
+CSRF_TOKEN = 'a' * 64
+UPLOAD_SIZE = 64 * 1024
+UPLOAD_PIECES = 8
+
+
+def scope(method, path, headers=()):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'localhost')] + list(headers),
+        'client': (REMOTE_ADDR, 0),
+    }
+
+
+class SlowInput(io.BytesIO):
+    """wsgi.input медленного клиента: куски тела приходят с паузами."""
+
+    def __init__(self, pieces, delay):
+        super().__init__(b''.join(pieces))
+        self.piece = len(pieces[0]) if pieces else 0
+        self.delay = delay
+
+    def read(self, size=-1):
+        data = b''
+        while size < 0 or len(data) < size:
+            if self.delay:
+                time.sleep(self.delay)
+            chunk = super().read(
+                self.piece if size < 0 else min(self.piece, size - len(data))
+            )
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+
+class ThreadedWSGI:
+    """Потоковый WSGI-сервер: поток занят с первого байта тела запроса."""
+
+    def __init__(self, application, threads):
+        self.application = application
+        self.executor = ThreadPoolExecutor(threads)
+
+    async def request(self, scope, pieces, delay):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.handle, scope, pieces, delay
+        )
+
+    def handle(self, scope, pieces, delay):
+        environ = build_environ(scope, io.BytesIO(b''.join(pieces)))
+        environ['wsgi.input'] = SlowInput(pieces, delay)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+
+        result = self.application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            result.close()
+        return started['status']
+
+
+class ASGI:
+    """Тот же Django за `core.asgi.ASGIHandler`."""
+
+    def __init__(self, application, threads):
+        self.handler = ASGIHandler(application, threads)
+
+    async def request(self, scope, pieces, delay):
+        pieces = list(pieces)
+        started = {}
+
+        async def receive():
+            if not pieces:
+                # Клиент дослал тело и ждёт ответа, не отключаясь.
+                await asyncio.Event().wait()
+            if delay:
+                await asyncio.sleep(delay)
+            return {
+                'type': 'http.request',
+                'body': pieces.pop(0),
+                'more_body': bool(pieces),
+            }
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                started['status'] = message['status']
+
+        await self.handler(scope, receive, send)
+        return started['status']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает WSGI и ASGI-вход под конкурентной нагрузкой: гости '
+        'читают ленты, а медленные клиенты тем временем загружают тела '
+        'запросов. Печатает пропускную способность и перцентили чтений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument(
+            '--threads', type=int, default=settings.ASGI_THREADS,
+            help='Потоки сервера в обоих режимах.'
+        )
+        parser.add_argument(
+            '--clients', type=int, default=16,
+            help='Сколько читателей делают запросы одновременно.'
+        )
+        parser.add_argument(
+            '--slow', type=int, default=8,
+            help='Сколько медленных загрузок идёт одновременно.'
+        )
+        parser.add_argument(
+            '--upload-seconds', type=float, default=1.0,
+            help='За сколько секунд медленный клиент досылает тело.'
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.prepare()
+        application = get_wsgi_application()
+        self.stdout.write(
+            f'{"mode":<8}{"rps":>10}{"uploads":>10}'
+            + ''.join(f'{f"p{percent}":>10}' for percent in PERCENTILES)
+        )
+        errors = 0
+        for mode, server in (
+            ('wsgi', ThreadedWSGI(application, options['threads'])),
+            ('asgi', ASGI(application, options['threads'])),
+        ):
+            urls = self.urls(options['requests'])
+            result = asyncio.run(self.run(server, urls, options))
+            errors += result['errors']
+            latencies = sorted(result['latencies'])
+            self.stdout.write(
+                f'{mode:<8}{len(latencies) / result["seconds"]:>10.1f}'
+                f'{result["uploads"]:>10}'
+                + ''.join(
+                    f'{percentile(latencies, percent):>10.1f}'
+                    for percent in PERCENTILES
+                )
+            )
+        self.stdout.write('rps — чтений в секунду, перцентили — в мс.')
+        if errors:
+            self.stdout.write(self.style.WARNING(
+                f'Ответов с ошибкой: {errors}.'
+            ))
+
+    def prepare(self):
+        self.post_ids = sample_pks(self.random, Post.objects, POST_SAMPLE)
+        if not self.post_ids:
+            raise CommandError('В базе нет постов: запустите generate_data.')
+        self.usernames = list(User.objects.filter(
+            posts__isnull=False
+        ).distinct().values_list('username', flat=True)[:1000])
+        self.group_slugs = list(Group.objects.values_list('slug', flat=True))
+
+    def urls(self, count):
+        names = self.random.choices(list(READS), list(READS.values()), k=count)
+        urls = []
+        for name in names:
+            if name == 'post_detail':
+                args = [self.random.choice(self.post_ids)]
+            elif name == 'profile':
+                args = [self.random.choice(self.usernames)]
+            elif name == 'group_list' and self.group_slugs:
+                args = [self.random.choice(self.group_slugs)]
+            else:
+                name, args = 'index', []
+            urls.append(reverse(f'posts:{name}', args=args))
+        return urls
+
+    async def run(self, server, urls, options):
+        result = {'latencies': [], 'errors': 0, 'uploads': 0}
+        done = asyncio.Event()
+        delay = options['upload_seconds'] / UPLOAD_PIECES
+
+        async def read():
+            while urls:
+                url = urls.pop()
+                start = time.perf_counter()
+                status = await server.request(scope('GET', url), [b''], 0)
+                result['latencies'].append(
+                    (time.perf_counter() - start) * 1000
+                )
+                if status >= 400:
+                    result['errors'] += 1
+
+        async def upload():
+            # Гость с верным CSRF-токеном: тело читается целиком,
+            # а view отвечает редиректом на вход.
+            body = urlencode({
+                'csrfmiddlewaretoken': CSRF_TOKEN,
+                'text': 'x' * UPLOAD_SIZE,
+            }).encode()
+            size = -(-len(body) // UPLOAD_PIECES)
+            pieces = [
+                body[start:start + size]
+                for start in range(0, len(body), size)
+            ]
+            upload_scope = scope('POST', reverse('posts:post_create'), [
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+                (b'cookie', f'csrftoken={CSRF_TOKEN}'.encode()),
+            ])
+            while not done.is_set():
+                status = await server.request(upload_scope, pieces, delay)
+                result['uploads'] += 1
+                if status >= 400:
+                    result['errors'] += 1
+
+        uploads = [
+            asyncio.ensure_future(upload()) for _ in range(options['slow'])
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*(read() for _ in range(options['clients'])))
+        result['seconds'] = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*uploads)
+        return result
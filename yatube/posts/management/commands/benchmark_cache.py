@@ -0,0 +1,89 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.cache import get_or_compute
+from posts.models import Post
+
+KEY = 'posts:benchmark:stampede'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def naive_get(key, compute, timeout):
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def protected_get(key, compute, timeout):
+    return get_or_compute(key, compute, timeout)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов к базе, когда много клиентов '
+        'одновременно попадают на протухший ключ кеша.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--timeout', type=float, default=0.2)
+        parser.add_argument(
+            '--slow', type=float, default=0.05,
+            help='Искусственная задержка пересчёта, секунды.'
+        )
+
+    def handle(self, *args, **options):
+        getters = (('naive', naive_get), ('protected', protected_get))
+        for name, getter in getters:
+            queries = self.run(getter, **options)
+            self.stdout.write(
+                f'{name:>10}: {queries} запросов к базе за '
+                f'{options["rounds"]} протуханий '
+                f'при {options["clients"]} клиентах'
+            )
+
+    def run(self, getter, clients, rounds, timeout, slow, **options):
+        counter = QueryCounter()
+        cache.delete(KEY)
+
+        def compute():
+            posts = list(Post.objects.values_list('pk', flat=True)[:10])
+            time.sleep(slow)
+            return posts
+
+        def client(barrier):
+            with connection.execute_wrapper(counter):
+                barrier.wait()
+                getter(KEY, compute, timeout)
+            connection.close()
+
+        for _ in range(rounds):
+            barrier = threading.Barrier(clients)
+            threads = [
+                threading.Thread(target=client, args=(barrier,))
+                for _ in range(clients)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Ждём мягкого срока (и жёсткого у наивного кеша).
+            time.sleep(timeout * 2)
+        return counter.count
@@ -0,0 +1,172 @@
+import math
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Group, Post
+
+User = get_user_model()
+
+# Доли запросов в смеси: чтение лент преобладает, запись редка.
+PROFILE = {
+    'index': 40,
+    'post_detail': 25,
+    'follow_index': 20,
+    'profile': 5,
+    'group_list': 4,
+    'add_comment': 4,
+    'post_create': 2,
+}
+PERCENTILES = (50, 95, 99)
+# Адрес не из INTERNAL_IPS, чтобы debug toolbar не встраивался в ответы.
+REMOTE_ADDR = '192.0.2.1'
+POST_SAMPLE = 1000
+SAMPLE_RUNS = 20
+
+
+def sample_pks(rng, queryset, count, runs=SAMPLE_RUNS):
+    """До `count` существующих ключей: короткие отрезки от случайных точек.
+
+    После удалений в ключах есть пропуски, и случайное число между
+    первым и последним ключом может не найтись. Каждый отрезок — один
+    запрос по индексу первичного ключа.
+    """
+    bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    size = max(1, -(-count // runs))
+    pks = set()
+    for _ in range(runs):
+        start = rng.randint(bounds['first'], bounds['last'])
+        pks.update(queryset.filter(pk__gte=start).order_by(
+            'pk'
+        ).values_list('pk', flat=True)[:size])
+    pks = sorted(pks)
+    rng.shuffle(pks)
+    return pks[:count]
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет смесь запросов на чтение и запись через тестовый клиент '
+        'и печатает p50/p95/p99 по каждому view. Пишет в базу: запускайте '
+        'на данных из generate_data, а не на рабочей базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--warmup', type=int, default=100,
+            help='Запросы до замеров: прогревают кеши и соединение.'
+        )
+        parser.add_argument(
+            '--clients', type=int, default=20,
+            help='Сколько разных читателей делают запросы.'
+        )
+        parser.add_argument(
+            '--clear-cache', action='store_true',
+            help='Очистить кеш перед прогоном.'
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.prepare(options['clients'])
+        if options['clear_cache']:
+            cache.clear()
+        names = list(PROFILE)
+        weights = list(PROFILE.values())
+        timings = {name: [] for name in names}
+        errors = 0
+        for number in range(options['warmup'] + options['requests']):
+            name, = self.random.choices(names, weights)
+            method, url, data = getattr(self, name)()
+            client = self.random.choice(self.clients)
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                errors += 1
+            if number >= options['warmup']:
+                timings[name].append(elapsed * 1000)
+        self.report(timings, errors)
+
+    def prepare(self, clients):
+        """Выбирает случайных читателей, посты и группы для запросов."""
+        self.post_ids = sample_pks(self.random, Post.objects, POST_SAMPLE)
+        if not self.post_ids:
+            raise CommandError('В базе нет постов: запустите generate_data.')
+        sample = sample_pks(self.random, User.objects, clients * 50)
+        self.usernames = list(User.objects.filter(pk__in=sample).values_list(
+            'username', flat=True
+        ))
+        self.group_slugs = list(Group.objects.values_list('slug', flat=True))
+        self.clients = []
+        for user in User.objects.filter(pk__in=sample[:clients]):
+            client = Client(REMOTE_ADDR=REMOTE_ADDR)
+            client.force_login(user)
+            self.clients.append(client)
+
+    def post_id(self):
+        return self.random.choice(self.post_ids)
+
+    def index(self):
+        return 'get', reverse('posts:index'), {}
+
+    def post_detail(self):
+        return 'get', reverse('posts:post_detail', args=[self.post_id()]), {}
+
+    def follow_index(self):
+        return 'get', reverse('posts:follow_index'), {}
+
+    def profile(self):
+        username = self.random.choice(self.usernames)
+        return 'get', reverse('posts:profile', args=[username]), {}
+
+    def group_list(self):
+        if not self.group_slugs:
+            return self.index()
+        slug = self.random.choice(self.group_slugs)
+        return 'get', reverse('posts:group_list', args=[slug]), {}
+
+    def add_comment(self):
+        url = reverse('posts:add_comment', args=[self.post_id()])
+        return 'post', url, {'text': 'Комментарий из нагрузочного теста'}
+
+    def post_create(self):
+        url = reverse('posts:post_create')
+        return 'post', url, {'text': 'Пост из нагрузочного теста'}
+
+    def report(self, timings, errors):
+        header = ['view', 'n'] + [f'p{percent}' for percent in PERCENTILES]
+        self.stdout.write(
+            f'{header[0]:<14}{header[1]:>7}'
+            + ''.join(f'{column:>10}' for column in header[2:] + ['max'])
+        )
+        for name, values in timings.items():
+            if not values:
+                continue
+            values.sort()
+            columns = [percentile(values, percent) for percent in PERCENTILES]
+            columns.append(values[-1])
+            self.stdout.write(
+                f'{name:<14}{len(values):>7}'
+                + ''.join(f'{value:>10.1f}' for value in columns)
+            )
+        self.stdout.write('Время — в миллисекундах.')
+        if errors:
+            self.stdout.write(self.style.WARNING(
+                f'Ответов с ошибкой: {errors}.'
+            ))
@@ -0,0 +1,140 @@
+import os
+import time
+from itertools import chain, islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts import thumbnails
+from posts.models import ImageBlob, PostImageVariant
+
+VARIANTS = PostImageVariant._meta.get_field('image').upload_to.strip('/')
+
+
+def scan(root, relative=''):
+    """Файлы каталога рекурсивно: (имя от MEDIA_ROOT, размер, mtime).
+
+    `os.scandir` отдаёт записи по одной, так что большой каталог
+    не собирается в список целиком.
+    """
+    try:
+        entries = os.scandir(os.path.join(root, relative))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            name = f'{relative}/{entry.name}' if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                yield name, stat.st_size, stat.st_mtime
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки, варианты и миниатюры, на которые не ссылается '
+        'ни один пост.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько места освободится.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=24 * 60 * 60,
+            help='Файлы моложе этого, в секундах, не трогаются: '
+                 'пост с ними может быть ещё не сохранён.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, dry_run, min_age, batch_size, **options):
+        born_before = time.time() - min_age
+        orphans = (
+            (name, size, blob)
+            for name, size, mtime, blob in chain(
+                self.unreferenced_uploads(), self.unreferenced_variants()
+            )
+            if mtime < born_before
+        )
+        files = reclaimed = 0
+        for batch in batches(orphans, batch_size):
+            if not dry_run:
+                batch = self.delete(batch)
+            files += len(batch)
+            reclaimed += sum(size for name, size, blob in batch)
+        verb = 'Можно удалить' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: {files} файлов, {filesizeformat(reclaimed)}.'
+        ))
+
+    def unreferenced_uploads(self):
+        """Картинки без ссылок и их миниатюры: (имя, размер, mtime, blob).
+
+        Кандидаты — строки `ImageBlob` с нулём ссылок, которые сигналы
+        поддерживают на каждом сохранении и удалении поста: ни посты,
+        ни каталог загрузок обходить не нужно.
+        """
+        blobs = list(ImageBlob.objects.filter(references=0).values_list(
+            'name', flat=True
+        ))
+        for blob in blobs:
+            for name in [blob, *thumbnails.thumbnail_names(blob)]:
+                try:
+                    stat = os.stat(os.path.join(settings.MEDIA_ROOT, name))
+                except FileNotFoundError:
+                    continue
+                yield name, stat.st_size, stat.st_mtime, blob
+
+    def unreferenced_variants(self):
+        """Файлы вариантов, которых нет в `PostImageVariant`.
+
+        Варианты удаляются вместе с постом каскадом, а ссылки на них
+        не считаются, поэтому их каталог сверяется с таблицей.
+        """
+        referenced = set(PostImageVariant.objects.values_list(
+            'image', flat=True
+        ).iterator())
+        for name, size, mtime in scan(settings.MEDIA_ROOT, VARIANTS):
+            if name not in referenced:
+                yield name, size, mtime, None
+
+    def delete(self, batch):
+        """Удаляет пачку файлов и возвращает то, что удалено на самом деле.
+
+        Пока шёл обход, на картинку мог сослаться новый пост, поэтому
+        ссылки перепроверяются перед удалением.
+        """
+        blobs = {blob for name, size, blob in batch if blob}
+        alive = set(ImageBlob.objects.filter(
+            name__in=blobs, references__gt=0
+        ).values_list('name', flat=True))
+        alive.update(PostImageVariant.objects.filter(
+            image__in=[name for name, size, blob in batch if not blob]
+        ).values_list('image', flat=True))
+        batch = [
+            (name, size, blob) for name, size, blob in batch
+            if (blob or name) not in alive
+        ]
+        names = [name for name, size, blob in batch]
+        for name in names:
+            default_storage.delete(name)
+        thumbnails.forget_thumbnails([
+            name for name in names
+            if name.startswith(thumbnail_settings.THUMBNAIL_PREFIX)
+        ])
+        ImageBlob.objects.filter(name__in=names, references=0).delete()
+        return batch
@@ -0,0 +1,222 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from faker import Faker
+
+from posts import counters, feeds
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Faker медленный для миллионов строк: тексты и имена берутся из пулов.
+POOL_SIZE = 1000
+
+
+def insert(model, objects, batch_size):
+    """Пишет объекты пачками, не собирая их в памяти целиком."""
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+@contextmanager
+def keep_pub_date(*models):
+    """Даёт `bulk_create` сохранить pub_date вместо текущего времени."""
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def zipf_weights(count, alpha):
+    """Накопленные веса степенного закона: k-й по популярности — 1/k^alpha.
+
+    Несколько авторов собирают большую часть подписок и пишут
+    большую часть постов, как в живой соцсети.
+    """
+    return list(accumulate(1 / rank ** alpha for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками со степенным распределением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок одного пользователя.'
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней назад разбросаны даты постов.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        texts = [self.faker.text(max_nb_chars=300) for _ in range(POOL_SIZE)]
+
+        user_ids = self.create_users(options['users'])
+        group_ids = self.create_groups(options['groups'])
+        # Одни и те же авторы популярны и как авторы, и как цель подписок.
+        self.random.shuffle(user_ids)
+        weights = zipf_weights(len(user_ids), options['alpha'])
+        self.write('Подписки', self.create_follows(
+            user_ids, weights, options['follows']
+        ))
+        with keep_pub_date(Post, Comment):
+            post_ids = self.create_posts(
+                options['posts'], user_ids, weights, group_ids, texts
+            )
+            self.write('Комментарии', self.create_comments(
+                options['comments'], post_ids, user_ids, texts
+            ))
+        # bulk_create не шлёт сигналов: счётчики и ленты собираются разом.
+        counters.rebuild()
+        feeds.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Данные сгенерированы, счётчики и ленты пересобраны.'
+        ))
+
+    def write(self, label, count):
+        self.stdout.write(f'{label}: {count}')
+
+    def new_ids(self, model, start_pk):
+        """Ключи только что вставленных строк: bulk_create их не отдаёт.
+
+        Ключи читаются из базы: в последовательности бывают пропуски,
+        а строки-конфликты `ignore_conflicts` не вставляет вовсе.
+        """
+        ids = list(model.objects.filter(pk__gt=start_pk).order_by(
+            'pk'
+        ).values_list('pk', flat=True))
+        self.write(model._meta.verbose_name_plural.capitalize(), len(ids))
+        return ids
+
+    def last_pk(self, model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+
+    def create_users(self, count):
+        start_pk = self.last_pk(User)
+        usernames = [self.faker.user_name() for _ in range(POOL_SIZE)]
+        first_names = [self.faker.first_name() for _ in range(POOL_SIZE)]
+        last_names = [self.faker.last_name() for _ in range(POOL_SIZE)]
+        # Хешировать пароль миллион раз слишком долго: вход по паролю
+        # синтетическим пользователям не нужен.
+        password = make_password(None)
+        insert(User, (
+            User(
+                username=f'{self.random.choice(usernames)}_{number}',
+                first_name=self.random.choice(first_names),
+                last_name=self.random.choice(last_names),
+                password=password,
+            )
+            for number in range(start_pk, start_pk + count)
+        ), self.batch_size)
+        return self.new_ids(User, start_pk)
+
+    def create_groups(self, count):
+        start_pk = self.last_pk(Group)
+        insert(Group, (
+            Group(
+                title=self.faker.catch_phrase()[:200],
+                slug=f'group-{start_pk + number}',
+                description=self.faker.sentence(),
+            )
+            for number in range(count)
+        ), self.batch_size)
+        return self.new_ids(Group, start_pk)
+
+    def create_follows(self, user_ids, weights, average):
+        def follows():
+            for user_id in user_ids:
+                wanted = min(
+                    len(user_ids) - 1,
+                    int(self.random.expovariate(1 / average)),
+                )
+                authors = set()
+                # Популярных авторов выпадает много, поэтому берём с запасом.
+                for _ in range(wanted * 3):
+                    if len(authors) == wanted:
+                        break
+                    author_id, = self.random.choices(
+                        user_ids, cum_weights=weights
+                    )
+                    if author_id != user_id:
+                        authors.add(author_id)
+                for author_id in authors:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        insert(Follow, follows(), self.batch_size)
+        return Follow.objects.count()
+
+    def pub_date(self):
+        return self.now - timedelta(
+            seconds=self.random.uniform(0, self.days * 24 * 60 * 60)
+        )
+
+    def create_posts(self, count, user_ids, weights, group_ids, texts):
+        start_pk = self.last_pk(Post)
+
+        def posts():
+            for _ in range(count):
+                group_id = None
+                if group_ids and self.random.random() < 0.5:
+                    group_id = self.random.choice(group_ids)
+                author_id, = self.random.choices(
+                    user_ids, cum_weights=weights
+                )
+                yield Post(
+                    author_id=author_id,
+                    group_id=group_id,
+                    text=self.random.choice(texts),
+                    pub_date=self.pub_date(),
+                )
+
+        insert(Post, posts(), self.batch_size)
+        return self.new_ids(Post, start_pk)
+
+    def create_comments(self, count, post_ids, user_ids, texts):
+        if not post_ids:
+            return 0
+        insert(Comment, (
+            Comment(
+                post_id=self.random.choice(post_ids),
+                author_id=self.random.choice(user_ids),
+                text=self.random.choice(texts),
+                pub_date=self.pub_date(),
+            )
+            for _ in range(count)
+        ), self.batch_size)
+        return count
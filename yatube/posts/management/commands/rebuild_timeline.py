@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import feeds
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def handle(self, *args, **options):
+        feeds.rebuild()
+        self.stdout.write(self.style.SUCCESS('Ленты подписок пересобраны.'))
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Group = apps.get_model('posts', 'Group')
+    Comment = apps.get_model('posts', 'Comment')
+    AuthorCounter = apps.get_model('posts', 'AuthorCounter')
+
+    def counts(queryset, field):
+        return Coalesce(models.Subquery(
+            queryset.filter(**{field: models.OuterRef('pk')}).order_by()
+            .values(field).annotate(total=models.Count('pk'))
+            .values('total')
+        ), 0)
+
+    Group.objects.update(posts_count=counts(Post.objects, 'group'))
+    Post.objects.update(comments_count=counts(Comment.objects, 'post'))
+    AuthorCounter.objects.bulk_create(
+        AuthorCounter(user_id=row['author'], posts_count=row['total'])
+        for row in Post.objects.order_by().values('author')
+        .annotate(total=models.Count('pk'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Количество постов')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:18
+
+from django.db import migrations, models
+
+
+def fill_followers_count(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorCounter = apps.get_model('posts', 'AuthorCounter')
+    for row in Follow.objects.order_by().values('author').annotate(
+        total=models.Count('pk')
+    ):
+        AuthorCounter.objects.update_or_create(
+            user_id=row['author'],
+            defaults={'followers_count': row['total']},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorcounter',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(fill_followers_count, migrations.RunPython.noop),
+    ]
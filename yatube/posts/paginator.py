@@ -0,0 +1,109 @@
+import base64
+import json
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id) без COUNT и OFFSET.
+
+    Позиция и номер страницы передаются в непрозрачном курсоре `?cursor=`,
+    поэтому время отдачи страницы не зависит от её глубины.
+    Возвращает обычный `Page`, ссылки на соседние страницы лежат
+    в `page.next_cursor` и `page.previous_cursor`.
+    `keys` — поля сортировки в `object_list`, на странице всегда посты.
+    """
+    keys = ('pub_date', 'id')
+
+    def __init__(self, object_list, per_page, keys=None):
+        if keys is not None:
+            self.keys = keys
+        date_key, id_key = self.keys
+        super().__init__(
+            object_list.order_by(f'-{date_key}', f'-{id_key}'), per_page
+        )
+
+    def get_cursor_page(self, cursor=None):
+        position, number, direction = self.decode_cursor(cursor)
+        backwards = direction == PREVIOUS
+        items = self.fetch(position, backwards, self.per_page + 1)
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            if not has_more:
+                return self.get_cursor_page()
+            items.reverse()
+        return self.make_page(items, number, has_more or backwards)
+
+    def fetch(self, position, backwards, limit):
+        queryset = self.object_list
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, backwards))
+        if backwards:
+            queryset = queryset.reverse()
+        return list(queryset[:limit])
+
+    def seek(self, position, backwards):
+        """Условие «строго после позиции» в порядке обхода.
+
+        Первое условие по дате держит запрос в диапазоне индекса,
+        второе добирает записи с той же датой по id.
+        """
+        date_key, id_key = self.keys
+        pub_date, pk = position
+        if backwards:
+            return Q(**{f'{date_key}__gte': pub_date}) & (
+                Q(**{f'{date_key}__gt': pub_date})
+                | Q(**{f'{id_key}__gt': pk})
+            )
+        return Q(**{f'{date_key}__lte': pub_date}) & (
+            Q(**{f'{date_key}__lt': pub_date}) | Q(**{f'{id_key}__lt': pk})
+        )
+
+    def make_page(self, items, number, has_next):
+        # num_pages известно только до следующей страницы — COUNT не нужен.
+        self.num_pages = number + 1 if has_next else number
+        page = self._get_page(items, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if has_next:
+            page.next_cursor = self.encode_cursor(items[-1], number + 1, NEXT)
+        if number > 1 and items:
+            page.previous_cursor = self.encode_cursor(
+                items[0], number - 1, PREVIOUS
+            )
+        return page
+
+    def encode_cursor(self, post, number, direction):
+        raw = json.dumps([
+            post.pub_date.isoformat(),
+            post.pk,
+            number,
+            direction,
+        ])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Разбирает курсор, при любой ошибке — первая страница."""
+        if not cursor:
+            return None, 1, NEXT
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode())
+            pub_date, pk, number, direction = json.loads(raw)
+            pub_date = parse_datetime(pub_date)
+            if (
+                pub_date is None
+                or direction not in (NEXT, PREVIOUS)
+                or int(number) < 1
+            ):
+                raise ValueError(cursor)
+            return (pub_date, int(pk)), int(number), direction
+        except (ValueError, TypeError):
+            return None, 1, NEXT
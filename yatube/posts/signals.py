@@ -0,0 +1,152 @@
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from . import counters, events, feeds, thumbnails
+from .cache import (
+    FEED, GROUPS, author_scope, bump, follow_scope, post_scope
+)
+from .models import Comment, Follow, Group, Post, User
+
+# Что карточка поста показывает об авторе.
+AUTHOR_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    author_id = None if created else loaded.get(
+        'author_id', instance.author_id
+    )
+    if author_id != instance.author_id:
+        counters.change_author(author_id, 'posts_count', -1)
+        counters.change_author(instance.author_id, 'posts_count', 1)
+    group_id = None if created else loaded.get('group_id', instance.group_id)
+    if group_id != instance.group_id:
+        counters.change(Group, group_id, 'posts_count', -1)
+        counters.change(Group, instance.group_id, 'posts_count', 1)
+    loaded.update(author_id=instance.author_id, group_id=instance.group_id)
+    instance._loaded_values = loaded
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feeds.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def notify_new_post(sender, instance, created, raw=False, **kwargs):
+    # Читатель, получив событие, сразу пойдёт за постом: он должен
+    # быть уже в базе.
+    if created and not raw:
+        transaction.on_commit(lambda: events.publish(instance))
+
+
+@receiver(post_save, sender=Post)
+def change_post_image(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    image = None if created else loaded.get('image', instance.image.name)
+    if instance.image.name != image:
+        counters.change_image(image, -1)
+        counters.change_image(instance.image.name, 1)
+        if instance.image:
+            thumbnails.schedule(instance)
+    loaded['image'] = instance.image.name
+    instance._loaded_values = loaded
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_author(instance.author_id, 'posts_count', -1)
+    counters.change(Group, instance.group_id, 'posts_count', -1)
+    counters.change_image(instance.image.name, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(Post, instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change(Post, instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_author(instance.author_id, 'followers_count', 1)
+        feeds.followers_changed(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_author(instance.author_id, 'followers_count', -1)
+    feeds.followers_changed(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    feeds.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    bump(FEED, post_scope(instance.pk), author_scope(instance.author_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    bump(FEED, GROUPS)
+
+
+def author_names(user):
+    # Отложенные поля не читаются: это был бы запрос на каждого автора.
+    return {name: user.__dict__.get(name) for name in AUTHOR_NAME_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_author_names(sender, instance, **kwargs):
+    # У User нет своего from_db, как у Post: загруженное имя
+    # запоминается при создании объекта.
+    instance._loaded_names = author_names(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, raw=False, **kwargs):
+    # Имя автора — в карточках всех его постов. Новый пользователь,
+    # вход и смена пароля ленты не трогают.
+    names = author_names(instance)
+    loaded = getattr(instance, '_loaded_names', {})
+    instance._loaded_names = names
+    if created or raw or names == loaded:
+        return
+    bump(FEED, author_scope(instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comments(sender, instance, **kwargs):
+    bump(post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    bump(follow_scope(instance.user_id))
@@ -0,0 +1,40 @@
+import hashlib
+import os
+from uuid import uuid4
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файл под хешем содержимого: одинаковые картинки — один файл.
+
+    Имя — `<каталог upload_to>/<два знака хеша>/<sha256><расширение>`.
+    Если такой файл уже есть, содержимое второй раз не пишется.
+    Одно имя может стоять у многих постов, поэтому ссылки на него
+    считает `ImageBlob`, и удаление поста файл не трогает.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя из upload_to всё равно заменится хешем в _save.
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        directory, basename = os.path.split(name)
+        name = os.path.join(
+            directory,
+            hexdigest[:2],
+            hexdigest + os.path.splitext(basename)[1].lower(),
+        )
+        if self.exists(name):
+            return name
+        # Пишем во временное имя и атомарно переименовываем: два
+        # одновременных поста с одной картинкой запишут одни и те же байты.
+        temporary = super()._save(f'{name}.{uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -0,0 +1,54 @@
+from django import template
+from django.conf import settings
+
+from ..cache import fragment_key, get_or_compute
+
+register = template.Library()
+
+
+class CacheFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        request = context.get('request')
+        if request is None:
+            return self.nodelist.render(context)
+        key = fragment_key(
+            request,
+            self.name.resolve(context),
+            context.get('cache_scopes', ()),
+            [var.resolve(context) for var in self.vary_on],
+        )
+        return get_or_compute(
+            key,
+            lambda: self.nodelist.render(context),
+            settings.POSTS_CACHE_TIMEOUT,
+        )
+
+
+@register.tag
+def cachefragment(parser, token):
+    """Кеширует общую для всех читателей часть страницы.
+
+    {% cachefragment 'index' %}...{% endcachefragment %}
+
+    Запись живёт до смены поколений из `cache_scopes` в контексте.
+    Всё, что зависит от читателя (шапка, кнопка подписки, форма
+    комментария), остаётся снаружи и рисуется на каждый запрос.
+    Дополнительные аргументы входят в ключ, например `user.pk`.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} ожидает имя фрагмента'
+        )
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -0,0 +1,25 @@
+from django import template
+
+from ..thumbnails import ready_thumbnail
+from ..variants import picture_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/picture.html')
+def post_picture(post, geometry, sizes='100vw'):
+    """Картинка поста в пропорциях `geometry`.
+
+    Есть варианты — `<picture>` с `srcset` по форматам; нет — готовая
+    миниатюра sorl или заглушка, пока фоновая задача не отработала.
+    """
+    context = {
+        'post': post,
+        'sizes': sizes,
+        'ratio': geometry.replace('x', ' / '),
+    }
+    if post.image:
+        context['sources'], context['fallback'] = picture_sources(post)
+        if context['fallback'] is None:
+            context['thumbnail'] = ready_thumbnail(post, geometry)
+    return context
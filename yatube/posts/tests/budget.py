@@ -0,0 +1,60 @@
+import time
+from collections import namedtuple
+from unittest import mock
+
+from django.db import connection
+
+from .. import views
+
+# Время — в миллисекундах. Запас по времени большой: тест ловит
+# порядок величины (N+1, лишний обход), а не шум машины.
+Budget = namedtuple('Budget', 'queries sql_ms render_ms')
+Budget.__new__.__defaults__ = (50, 250)
+Measurement = namedtuple('Measurement', 'queries sql_ms render_ms')
+
+
+def measure(client, url, method='get', data=None):
+    """Ответ на запрос и его замеры: число SQL, время SQL и рендера.
+
+    Рендером считается вызов `render` во view: туда входят и запросы
+    ленивой страницы, которая читается только из шаблона.
+    """
+    renders = []
+    queries = []
+
+    def timed_query(execute, *args):
+        start = time.perf_counter()
+        try:
+            return execute(*args)
+        finally:
+            queries.append(time.perf_counter() - start)
+
+    def timed_render(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return render(*args, **kwargs)
+        finally:
+            renders.append(time.perf_counter() - start)
+
+    render = views.render
+    with mock.patch.object(views, 'render', timed_render):
+        with connection.execute_wrapper(timed_query):
+            response = getattr(client, method)(url, data or {})
+    return response, Measurement(
+        len(queries), sum(queries) * 1000, sum(renders) * 1000
+    )
+
+
+class BudgetMixin:
+    """Проверка, что запрос к странице укладывается в `Budget`."""
+
+    def assertWithinBudget(self, client, url, budget, **kwargs):
+        response, spent = measure(client, url, **kwargs)
+        over = [
+            f'{name}: {value:g} > {limit:g}'
+            for name, value, limit in zip(Budget._fields, spent, budget)
+            if value > limit
+        ]
+        if over:
+            self.fail(f'{url} не уложился в бюджет: ' + ', '.join(over))
+        return response
@@ -0,0 +1,111 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from ..models import AuthorCounter, Comment, Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'generate_data',
+            '--users=40',
+            '--groups=3',
+            '--posts=400',
+            '--comments=100',
+            '--follows=5',
+            '--seed=1',
+            stdout=StringIO(),
+        )
+
+    def test_generated_data(self):
+        """Данные созданы пачками, счётчики и ленты пересобраны"""
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), 400)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(
+            AuthorCounter.objects.aggregate(Sum('posts_count')),
+            {'posts_count__sum': 400},
+        )
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(TimelineEntry.objects.exists())
+        day_ago = timezone.now() - timezone.timedelta(days=1)
+        self.assertTrue(Post.objects.filter(pub_date__lt=day_ago).exists())
+
+    def test_authors_follow_power_law(self):
+        """Самый популярный автор пишет в разы больше среднего"""
+        top = Post.objects.values('author').annotate(
+            total=Count('pk')
+        ).order_by('-total').first()
+        self.assertGreater(top['total'], 400 / 40 * 3)
+
+    def test_benchmark_reports_percentiles(self):
+        """Нагрузочный прогон печатает перцентили по каждому view"""
+        out = StringIO()
+        call_command(
+            'benchmark_views',
+            '--requests=60',
+            '--warmup=5',
+            '--clients=3',
+            '--seed=1',
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn('p95', output)
+        self.assertIn('p99', output)
+        self.assertIn('index', output)
+        self.assertNotIn('Ответов с ошибкой', output)
+
+    def test_deleted_posts_are_not_requested(self):
+        """После удалений в выборку попадают только существующие посты"""
+        Post.objects.filter(pk__in=Post.objects.values_list(
+            'pk', flat=True
+        )[::2]).delete()
+        out = StringIO()
+        call_command(
+            'benchmark_views',
+            '--requests=60',
+            '--warmup=5',
+            '--clients=3',
+            '--seed=2',
+            stdout=out,
+        )
+        self.assertNotIn('Ответов с ошибкой', out.getvalue())
+
+
+class AsgiBenchmarkTest(TransactionTestCase):
+    def test_benchmark_compares_wsgi_and_asgi(self):
+        """Сравнение печатает обе строки, ответы без ошибок"""
+        call_command(
+            'generate_data',
+            '--users=10',
+            '--groups=2',
+            '--posts=50',
+            '--comments=10',
+            '--follows=2',
+            '--seed=1',
+            stdout=StringIO(),
+        )
+        out = StringIO()
+        call_command(
+            'benchmark_asgi',
+            '--requests=20',
+            '--threads=2',
+            '--clients=2',
+            '--slow=1',
+            '--upload-seconds=0.05',
+            '--seed=1',
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertRegex(output, r'\nwsgi +\d')
+        self.assertRegex(output, r'\nasgi +\d')
+        self.assertNotIn('Ответов с ошибкой', output)
@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from .. import urls
+from ..models import Comment, Group, Post
+from .budget import Budget, BudgetMixin
+
+User = get_user_model()
+
+
+class ViewBudgetTest(BudgetMixin, TestCase):
+    """У каждого адреса из `posts/urls.py` есть бюджет запросов и времени.
+
+    Бюджет запросов равен тому, сколько страница тратит сейчас:
+    если изменение его превысило, поднимайте число осознанно.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Perry')
+        cls.reader = User.objects.create_user(username='Carla')
+        cls.group = Group.objects.create(
+            title='Хирургия',
+            slug='surgery',
+            description='Больничные будни',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            group=cls.group,
+            text='Ты думаешь, мне не всё равно?',
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Всё равно'
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def budgets(self):
+        """Адрес, клиент, параметры запроса и бюджет для каждого имени."""
+        post = {'post_id': self.post.pk}
+        author = {'username': self.author.username}
+        return {
+            'index': ({}, self.reader_client, {}, Budget(3)),
+            'group_list': (
+                {'slug': self.group.slug}, self.reader_client, {}, Budget(4)
+            ),
+            'profile': (author, self.reader_client, {}, Budget(5)),
+            'post_detail': (post, self.reader_client, {}, Budget(4)),
+            'post_create': ({}, self.author_client, {}, Budget(3)),
+            'post_edit': (post, self.author_client, {}, Budget(5)),
+            'add_comment': (
+                post,
+                self.reader_client,
+                {'method': 'post', 'data': {'text': 'Комментарий'}},
+                Budget(5),
+            ),
+            'follow_index': ({}, self.reader_client, {}, Budget(5)),
+            'new_posts': ({}, self.reader_client, {}, Budget(3)),
+            'profile_follow': (author, self.reader_client, {}, Budget(12)),
+            'profile_unfollow': (author, self.reader_client, {}, Budget(8)),
+        }
+
+    def test_every_url_has_budget(self):
+        """Новый адрес без бюджета не пройдёт незамеченным"""
+        self.assertEqual(
+            {pattern.name for pattern in urls.urlpatterns},
+            set(self.budgets()),
+        )
+
+    def test_views_within_budget(self):
+        """Страницы укладываются в бюджет запросов и времени"""
+        for name, (kwargs, client, request, budget) in self.budgets().items():
+            with self.subTest(name=name):
+                cache.clear()
+                url = reverse(f'posts:{name}', kwargs=kwargs)
+                response = self.assertWithinBudget(
+                    client, url, budget, **request
+                )
+                self.assertLess(response.status_code, 400)
+
+    def test_over_budget_fails(self):
+        """Превышение бюджета называет адрес и перерасход"""
+        url = reverse('posts:index')
+        with self.assertRaisesMessage(AssertionError, 'queries: 1 > 0'):
+            self.assertWithinBudget(Client(), url, Budget(0))
@@ -0,0 +1,320 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..cache import (
+    FEED, GENERATION_KEY, follow_scope, follow_scopes, generation,
+    generations, get_or_compute, post_card_key, post_scope
+)
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Elliot')
+        cls.group = Group.objects.create(
+            title='Quotes',
+            slug='of-great-men',
+            description='цитаты из фильмов и сериалов',
+        )
+
+    def setUp(self):
+        self.post = Post.objects.create(
+            author=self.user,
+            group=self.group,
+            text='Я не спала с тобой ради пиццы.'
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def test_card_is_shared_between_pages(self):
+        """Карточка рендерится один раз и переиспользуется лентами"""
+        self.client.get(reverse('posts:index'))
+        key = post_card_key(self.post)
+        cached = cache.get(key)
+        self.assertIn(self.post.text, cached)
+        cache.set(key, cached.replace(self.post.text, 'из кеша'))
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+        self.assertContains(response, 'из кеша')
+
+    def test_edit_invalidates_card(self):
+        """Редактирование поста сбрасывает его карточку"""
+        self.client.get(
+            reverse('posts:profile', kwargs={'username': self.user})
+        )
+        old_key = post_card_key(self.post)
+        self.assertIsNotNone(cache.get(old_key))
+        self.client.post(
+            reverse('posts:post_edit', args=[self.post.pk]),
+            data={'text': 'Новый текст', 'group': self.group.pk},
+        )
+        self.assertIsNone(cache.get(old_key))
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+        self.assertContains(response, 'Новый текст')
+        self.post.refresh_from_db()
+        self.assertIsNotNone(cache.get(post_card_key(self.post)))
+
+    def test_renamed_author_gets_new_card(self):
+        """Новое имя автора не ждёт, пока карточка истечёт"""
+        self.client.get(reverse('posts:index'))
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Эллиот'
+        author.last_name = 'Рид'
+        author.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Эллиот Рид')
+
+
+class GenerationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Carla')
+        cls.post = Post.objects.create(author=cls.user, text='Бэмби!')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def test_writes_bump_generations(self):
+        """Записи сдвигают поколения своих областей"""
+        writes = {
+            'post_create': (
+                lambda: self.client.post(
+                    reverse('posts:post_create'), {'text': 'Новый'}
+                ),
+                [FEED],
+            ),
+            'post_edit': (
+                lambda: self.client.post(
+                    reverse('posts:post_edit', args=[self.post.pk]),
+                    {'text': 'Правка'},
+                ),
+                [FEED, post_scope(self.post.pk)],
+            ),
+            'add_comment': (
+                lambda: self.client.post(
+                    reverse('posts:add_comment', args=[self.post.pk]),
+                    {'text': 'Комментарий'},
+                ),
+                [post_scope(self.post.pk)],
+            ),
+            'group': (
+                lambda: Group.objects.create(
+                    title='Admin', slug='admin', description='из админки'
+                ),
+                [FEED],
+            ),
+        }
+        for name, (write, scopes) in writes.items():
+            with self.subTest(write=name):
+                before = [generation(scope) for scope in scopes]
+                write()
+                after = [generation(scope) for scope in scopes]
+                for old, new in zip(before, after):
+                    self.assertGreater(new, old)
+
+    def test_account_changes_keep_feed(self):
+        """Регистрация, вход и смена пароля не сбрасывают кеш ленты"""
+        before = generation(FEED)
+        user = User.objects.create_user(username='Todd', password='x')
+        user.set_password('высокая пятёрка')
+        user.save()
+        self.client.force_login(user)
+        User.objects.get(pk=user.pk).save()
+        self.assertEqual(generation(FEED), before)
+        user.last_name = 'Квинлан'
+        user.save()
+        self.assertGreater(generation(FEED), before)
+
+    def test_comment_keeps_feed(self):
+        """Комментарий не сбрасывает кеш ленты"""
+        before = generation(FEED)
+        Comment.objects.create(post=self.post, author=self.user, text='…')
+        self.assertEqual(generation(FEED), before)
+
+    def test_lost_generation_does_not_revive_old_pages(self):
+        """Вытесненный счётчик начинается заново с большего значения"""
+        before = generation(FEED)
+        cache.delete(GENERATION_KEY.format(FEED))
+        self.assertGreater(generation(FEED), before)
+
+    def test_index_sees_new_post_immediately(self):
+        """Новый пост виден на главной сразу"""
+        self.client.get(reverse('posts:index'))
+        Post.objects.create(author=self.user, text='Свежий пост')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Свежий пост')
+
+
+class FragmentCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Turk')
+        cls.reader = User.objects.create_user(username='Todd')
+        cls.post = Post.objects.create(author=cls.author, text='Орёл!')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Дай пять'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        cache.clear()
+
+    def test_body_is_shared_between_users(self):
+        """Тело ленты общее, шапка у каждого своя"""
+        self.guest_client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.text)
+        self.assertContains(response, 'Пользователь: Todd')
+        for query in queries.captured_queries:
+            self.assertNotIn('"posts_post"', query['sql'])
+
+    def test_pages_do_not_leak_between_users(self):
+        """Закешированная страница не отдаёт чужую шапку"""
+        for url in (reverse('posts:index'), reverse('posts:follow_index')):
+            with self.subTest(url=url):
+                self.reader_client.get(url)
+                response = self.author_client.get(url)
+                self.assertContains(response, 'Пользователь: Turk')
+                self.assertNotContains(response, 'Todd')
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пользователь:')
+
+    def test_user_parts_are_not_cached(self):
+        """Кнопка подписки и форма комментария рисуются для читателя"""
+        profile = reverse('posts:profile', kwargs={'username': self.author})
+        detail = reverse('posts:post_detail', args=[self.post.pk])
+        for url in (profile, detail):
+            self.guest_client.get(url)
+        response = self.reader_client.get(profile)
+        self.assertContains(response, 'Отписаться')
+        response = self.author_client.get(profile)
+        self.assertNotContains(response, 'Отписаться')
+        self.assertNotContains(response, 'Подписаться')
+        response = self.reader_client.get(detail)
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'Дай пять')
+        self.assertNotContains(response, 'редактировать запись')
+        response = self.author_client.get(detail)
+        self.assertContains(response, 'редактировать запись')
+
+    def test_follow_feed_hit_skips_feed_queries(self):
+        """Попадание в кеш ленты подписок не читает ни ленту, ни подписки"""
+        self.reader_client.get(reverse('posts:follow_index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, self.post.text)
+        for query in queries.captured_queries:
+            self.assertNotIn('"posts_timelineentry"', query['sql'])
+            self.assertNotIn('"posts_follow"', query['sql'])
+
+    def test_post_bumps_only_its_author(self):
+        """Пост сдвигает поколение автора, а не ленты его подписчиков"""
+        fans = [
+            User.objects.create_user(username=f'Fan{number}')
+            for number in range(3)
+        ]
+        Follow.objects.bulk_create(
+            Follow(user=fan, author=self.author) for fan in fans
+        )
+        scopes = follow_scopes(self.reader.pk)
+        before = generations(scopes)
+        stranger = User.objects.create_user(username='Kelso')
+        Post.objects.create(author=stranger, text='Кофе без кофеина')
+        self.assertEqual(generations(scopes), before)
+        Post.objects.create(author=self.author, text='Новый орёл')
+        self.assertNotEqual(generations(scopes), before)
+        for fan in fans:
+            self.assertIsNone(
+                cache.get(GENERATION_KEY.format(follow_scope(fan.pk)))
+            )
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Новый орёл')
+
+    def test_follow_invalidates_follow_feed(self):
+        """Подписка сразу меняет ленту подписок читателя"""
+        other = User.objects.create_user(username='Kelso')
+        Post.objects.create(author=other, text='Кофе без кофеина')
+        self.reader_client.get(reverse('posts:follow_index'))
+        Follow.objects.create(user=self.reader, author=other)
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Кофе без кофеина')
+
+
+class StampedeTest(SimpleTestCase):
+    clients = 30
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def compute(self):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(0.05)
+        return self.calls
+
+    def hit_concurrently(self, timeout=60):
+        barrier = threading.Barrier(self.clients)
+        results = []
+
+        def client():
+            barrier.wait()
+            results.append(get_or_compute('stampede', self.compute, timeout))
+
+        threads = [
+            threading.Thread(target=client) for _ in range(self.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_cold_key_is_computed_once(self):
+        """Пустой ключ пересчитывает один клиент, остальные ждут"""
+        results = self.hit_concurrently()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [1] * self.clients)
+
+    def test_expired_key_serves_stale(self):
+        """Протухший ключ обновляет один клиент, остальные получают старое"""
+        # Запись живёт вдвое дольше мягкого срока: запас, чтобы все
+        # клиенты успели прийти, пока старое значение ещё есть.
+        get_or_compute('stampede', self.compute, 0.5)
+        time.sleep(0.6)
+        results = self.hit_concurrently()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(set(results), {1, 2})
+
+    def test_fresh_key_is_not_recomputed(self):
+        """Свежий ключ не пересчитывается"""
+        get_or_compute('stampede', self.compute, 60)
+        self.hit_concurrently()
+        self.assertEqual(self.calls, 1)
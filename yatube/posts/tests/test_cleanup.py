@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template.defaultfilters import filesizeformat
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .. import thumbnails
+from ..models import ImageBlob, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CleanupMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Laverne')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content):
+        with mock.patch.object(thumbnails, 'schedule'):
+            post = Post.objects.create(
+                author=self.user,
+                text='Будь хорошим человеком.',
+                image=SimpleUploadedFile(
+                    'small.gif', content, content_type='image/gif'
+                ),
+            )
+        thumbnails.generate(post)
+        return post
+
+    def files(self, post):
+        names = [post.image.name]
+        names += thumbnails.thumbnail_names(post.image.name)
+        names += post.variants.values_list('image', flat=True)
+        return names
+
+    def setUp(self):
+        self.kept = self.create_post(SMALL_GIF)
+        deleted = self.create_post(SMALL_GIF + b'\x00')
+        self.orphans = self.files(deleted)
+        self.image_name = deleted.image.name
+        deleted.delete()
+
+    def records(self):
+        return thumbnails.read_many({
+            name: ImageFile(name, default.storage)
+            for name in thumbnails.thumbnail_names(self.image_name)
+        })
+
+    def cleanup(self, *args):
+        out = StringIO()
+        call_command('cleanup_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_reports_without_deleting(self):
+        """Пробный запуск считает байты и ничего не удаляет"""
+        size = sum(default_storage.size(name) for name in self.orphans)
+        output = self.cleanup('--dry-run', '--min-age=0')
+        self.assertIn(f'Можно удалить: {len(self.orphans)} файлов', output)
+        self.assertIn(filesizeformat(size), output)
+        for name in self.orphans:
+            self.assertTrue(default_storage.exists(name))
+
+    def test_orphans_are_deleted(self):
+        """Удаляются только файлы без ссылок вместе с записями о них"""
+        self.assertNotIn(None, self.records().values())
+        self.cleanup('--min-age=0', '--batch-size=2')
+        for name in self.orphans:
+            with self.subTest(orphan=name):
+                self.assertFalse(default_storage.exists(name))
+        for name in self.files(self.kept):
+            with self.subTest(kept=name):
+                self.assertTrue(default_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(
+            name=self.image_name
+        ).exists())
+        self.assertEqual(set(self.records().values()), {None})
+
+    def test_referenced_blobs_are_kept(self):
+        """Картинку со ссылками в ImageBlob не трогают"""
+        ImageBlob.objects.filter(name=self.image_name).update(references=1)
+        self.cleanup('--min-age=0')
+        self.assertTrue(default_storage.exists(self.image_name))
+        for name in thumbnails.thumbnail_names(self.image_name):
+            self.assertTrue(default_storage.exists(name))
+
+    def test_young_files_are_kept(self):
+        """Свежие файлы не трогаются: их пост может быть ещё в пути"""
+        self.cleanup()
+        self.assertTrue(default_storage.exists(self.image_name))
+        self.assertTrue(os.listdir(TEMP_MEDIA_ROOT))
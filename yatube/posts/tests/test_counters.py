@@ -0,0 +1,105 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..counters import author_posts_count
+from ..models import AuthorCounter, Comment, Group, Post
+
+User = get_user_model()
+
+
+class CounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Dwight')
+        cls.group = Group.objects.create(
+            title='Quotes',
+            slug='of-great-men',
+            description='цитаты из фильмов и сериалов',
+        )
+        cls.other_group = Group.objects.create(
+            title='Beets',
+            slug='schrute-farms',
+            description='свёкла',
+        )
+
+    def setUp(self):
+        self.post = Post.objects.create(
+            author=self.user,
+            group=self.group,
+            text='Сначала медведь съест тебя, потом ты — медведя.'
+        )
+        self.client = Client()
+
+    def assertCounts(self, author, group, other_group, comments):
+        self.user.refresh_from_db()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(author_posts_count(self.user), author)
+        self.assertEqual(self.group.posts_count, group)
+        self.assertEqual(self.other_group.posts_count, other_group)
+        if comments is not None:
+            self.post.refresh_from_db()
+            self.assertEqual(self.post.comments_count, comments)
+
+    def test_create_and_delete(self):
+        """Счётчики меняются при создании и удалении"""
+        self.assertCounts(1, 1, 0, 0)
+        Comment.objects.create(post=self.post, author=self.user, text='Да.')
+        self.assertCounts(1, 1, 0, 1)
+        self.post.comments.all().delete()
+        self.assertCounts(1, 1, 0, 0)
+        self.post.delete()
+        self.assertCounts(0, 0, 0, None)
+
+    def test_change_group(self):
+        """Перенос поста в другую группу переносит счётчик"""
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertCounts(1, 0, 1, 0)
+        post.group = None
+        post.save()
+        self.assertCounts(1, 0, 0, 0)
+
+    def test_cascade(self):
+        """Удаление автора каскадно обнуляет счётчики группы"""
+        author = User.objects.create_user(username='Mose')
+        post = Post.objects.create(author=author, group=self.group, text='…')
+        Comment.objects.create(post=post, author=self.user, text='Нет.')
+        self.assertCounts(1, 2, 0, None)
+        author_id = author.pk
+        author.delete()
+        self.assertCounts(1, 1, 0, None)
+        self.assertFalse(
+            AuthorCounter.objects.filter(user_id=author_id).exists()
+        )
+
+    def test_rebuild_command(self):
+        """Команда rebuild_counters исправляет расхождения"""
+        Post.objects.update(comments_count=7)
+        Group.objects.update(posts_count=5)
+        AuthorCounter.objects.all().delete()
+        Comment.objects.create(post=self.post, author=self.user, text='Вопрос')
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCounts(1, 1, 0, 1)
+
+    def test_pages_without_aggregates(self):
+        """Страницы читают счётчики без COUNT"""
+        pages = [
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ]
+        for page in pages:
+            with self.subTest(page=page):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(page)
+                self.assertContains(response, 'Всего постов')
+                for query in queries.captured_queries:
+                    self.assertNotIn('COUNT(', query['sql'])
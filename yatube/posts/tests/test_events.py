@@ -0,0 +1,119 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.asgi import ASGI_KEY
+
+from .. import events
+from ..models import Follow, Post
+
+User = get_user_model()
+
+
+class NewPostEventsTest(TransactionTestCase):
+    """Посты публикуются после коммита, поэтому тест — с транзакциями."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overridden = override_settings(
+            EVENTS_LOCATION=os.path.join(directory, 'events.sqlite3'),
+            EVENTS_POLL_INTERVAL=0.01,
+            EVENTS_HEARTBEAT=0.05,
+            EVENTS_MAX_AGE=0.3,
+            EVENTS_STREAM=True,
+        )
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.reader = User.objects.create_user(username='Elliot')
+        self.author = User.objects.create_user(username='Turk')
+        self.stranger = User.objects.create_user(username='Janitor')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def stream(self, **extra):
+        """События `posts` из потока, пока он не закроется."""
+        response = self.client.get(reverse('posts:new_posts'), **extra)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return [
+            json.loads(line[len('data: '):])
+            for chunk in response.streaming_content
+            for line in chunk.decode().splitlines()
+            if line.startswith('data: ')
+        ]
+
+    def test_new_posts_are_counted_per_feed(self):
+        """Пост автора из подписок идёт в обе ленты, чужой — в общую"""
+        since = self.client.get(
+            reverse('posts:index')
+        ).context['events_since']
+        author = Client()
+        author.force_login(self.author)
+        author.post(reverse('posts:post_create'), {'text': 'Тёмные очки'})
+        Post.objects.create(author=self.stranger, text='Швабра')
+        Post.objects.create(author=self.reader, text='Свой пост')
+        self.assertEqual(
+            self.stream(data={'since': since}),
+            [{'index': 2, 'follow': 1}],
+        )
+
+    def test_reconnect_resumes_after_last_event(self):
+        """Last-Event-ID отдаёт только то, что вышло после него"""
+        Post.objects.create(author=self.author, text='Прочитано')
+        seen = events.last_seq()
+        Post.objects.create(author=self.author, text='Новое')
+        self.assertEqual(
+            self.stream(data={'since': 0}, HTTP_LAST_EVENT_ID=str(seen)),
+            [{'index': 1, 'follow': 1}],
+        )
+
+    def test_wsgi_stream_does_not_wait(self):
+        """Под WSGI поток без новых постов сразу закрывается"""
+        Post.objects.create(author=self.author, text='Прочитано')
+        with override_settings(EVENTS_MAX_AGE=60):
+            rows = self.stream(data={'since': events.last_seq()})
+        self.assertEqual(rows, [])
+
+    def test_live_events_reach_loop(self):
+        """Подписка будит ждущий цикл событий"""
+        broker = events.broker()
+        subscription = broker.subscribe(events.last_seq())
+        self.addCleanup(subscription.close)
+
+        async def wait():
+            waiting = asyncio.ensure_future(subscription.wait_async(1))
+            await asyncio.sleep(0.05)
+            Post.objects.create(author=self.author, text='Новый')
+            return await waiting
+
+        self.assertEqual(len(asyncio.run(wait())), 1)
+
+    def test_index_links_stream(self):
+        """Главная подключает поток с текущим номером журнала"""
+        Post.objects.create(author=self.author, text='Был до страницы')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response,
+            reverse('posts:new_posts') + f'?since={events.last_seq()}',
+        )
+
+    def test_banner_needs_setting_or_asgi(self):
+        """Без настройки плашка есть только у запросов через ASGI"""
+        with override_settings(EVENTS_STREAM=False):
+            for extra, shown in (({}, False), ({ASGI_KEY: True}, True)):
+                with self.subTest(extra=extra):
+                    response = self.client.get(
+                        reverse('posts:follow_index'), **extra
+                    )
+                    self.assertEqual(
+                        reverse('posts:new_posts') in str(response.content),
+                        shown,
+                    )
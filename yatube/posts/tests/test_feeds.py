@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from ..feeds import TimelinePaginator, follow_feed, rebuild
+from ..models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Kelso')
+        cls.author = User.objects.create_user(username='Cox')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Всё, что ты скажешь, будет использовано против тебя.'
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed(self):
+        response = self.client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка добавляет старые посты, отписка убирает их"""
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.feed(), [self.old_post])
+        self.client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_new_post_fans_out(self):
+        """Новый пост попадает в ленты подписчиков"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новенький')
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.author).exists()
+        )
+
+    def test_feed_is_single_query(self):
+        """Страница ленты читается одним запросом к таблице ленты"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        paginator = TimelinePaginator(
+            follow_feed(self.reader), settings.NUMBER_OF_POSTS
+        )
+        with self.assertNumQueries(1):
+            page = paginator.get_cursor_page()
+        self.assertEqual(list(page), [self.old_post])
+
+
+@override_settings(FEED_CELEBRITY_FOLLOWERS=2, NUMBER_OF_POSTS=3)
+class HybridFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='JD')
+        cls.fan = User.objects.create_user(username='Janitor')
+        cls.star = User.objects.create_user(username='Ted')
+        cls.friend = User.objects.create_user(username='Turk')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        Follow.objects.create(user=self.reader, author=self.friend)
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.fan, author=self.star)
+
+    def test_celebrity_posts_are_not_fanned_out(self):
+        """Посты «звезды» не раскладываются по лентам"""
+        Post.objects.create(author=self.star, text='Я пою в группе')
+        Post.objects.create(author=self.friend, text='Орёл!')
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists()
+        )
+        self.assertEqual(TimelineEntry.objects.count(), 1)
+
+    def test_crossing_threshold_moves_author_between_feeds(self):
+        """Бывшая «звезда» раскладывается по лентам, новая — убирается"""
+        post = Post.objects.create(author=self.star, text='Я пою в группе')
+        Follow.objects.filter(user=self.fan, author=self.star).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post
+        ).exists())
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+        Follow.objects.create(user=self.fan, author=self.star)
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists()
+        )
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_rebuild_skips_celebrities(self):
+        """Пересборка раскладывает посты всех авторов, кроме «звёзд»"""
+        Post.objects.create(author=self.star, text='Я пою в группе')
+        posts = [
+            Post.objects.create(author=self.friend, text=f'{number}')
+            for number in range(3)
+        ]
+        TimelineEntry.objects.all().delete()
+        with self.assertNumQueries(5):
+            rebuild()
+        self.assertQuerysetEqual(
+            TimelineEntry.objects.order_by('post_id'),
+            [(self.reader.pk, post.pk, post.pub_date) for post in posts],
+            transform=lambda entry: (
+                entry.user_id, entry.post_id, entry.pub_date
+            ),
+        )
+
+    def test_merged_pages_are_ordered(self):
+        """Лента сливает готовые и «звёздные» посты по дате"""
+        posts = [
+            Post.objects.create(
+                author=self.star if number % 2 else self.friend,
+                text=f'{number}'
+            )
+            for number in range(7)
+        ]
+        # Пост из прошлого, когда автор ещё не был «звездой».
+        TimelineEntry.objects.create(
+            user=self.reader,
+            post=posts[1],
+            author=self.star,
+            pub_date=posts[1].pub_date,
+        )
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(
+                reverse('posts:follow_index'),
+                {'cursor': cursor} if cursor else {}
+            )
+            page_obj = response.context['page_obj']
+            seen.extend(page_obj)
+            cursor = page_obj.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, posts[::-1])
+        response = self.client.get(
+            reverse('posts:follow_index'),
+            {'cursor': page_obj.previous_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), seen[3:6])
@@ -0,0 +1,67 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from ..feeds import TimelinePaginator, feed_posts, follow_feed
+from ..models import Group, Post
+from ..paginator import CursorPaginator
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class FeedIndexTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Leonard')
+        cls.group = Group.objects.create(
+            title='Quotes',
+            slug='of-great-men',
+            description='цитаты из фильмов и сериалов',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            group=cls.group,
+            text='Наша бабушка пропала. Мы её не видели с четверга.'
+        )
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def feed_queries(self):
+        """Запросы страниц так, как их строит piginator."""
+        feeds = {
+            'index': (feed_posts(), CursorPaginator),
+            'group_list': (
+                feed_posts(self.group.posts.all()), CursorPaginator
+            ),
+            'profile': (feed_posts(self.user.posts.all()), CursorPaginator),
+            'follow_index': (follow_feed(self.user), TimelinePaginator),
+        }
+        position = (self.post.pub_date, self.post.pk)
+        for name, (queryset, paginator_class) in feeds.items():
+            paginator = paginator_class(queryset, 10)
+            yield name, paginator.object_list[:11]
+            for backwards in (False, True):
+                seek = paginator.object_list.filter(
+                    paginator.seek(position, backwards)
+                )
+                if backwards:
+                    seek = seek.reverse()
+                yield f'{name} backwards={backwards}', seek[:11]
+        yield 'comments', self.post.comments.all()
+
+    def test_feeds_use_index_without_sort(self):
+        """Ленты читаются по индексу без временной сортировки"""
+        for name, queryset in self.feed_queries():
+            with self.subTest(feed=name):
+                plan = ' '.join(self.query_plan(queryset))
+                # Лента подписок читается из покрывающего индекса.
+                self.assertRegex(plan, 'USING (COVERING )?INDEX')
+                self.assertNotIn('TEMP B-TREE', plan)
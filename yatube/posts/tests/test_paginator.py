@@ -1,5 +1,7 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.conf import settings
 
@@ -51,5 +53,62 @@ class PaginatorTest(TestCase):
                 len(response.context['page_obj']),
                 settings.NUMBER_OF_POSTS
             )
-            response = self.authorized_client.get(page + '?page=2')
+            cursor = response.context['page_obj'].next_cursor
+            response = self.authorized_client.get(page, {'cursor': cursor})
             self.assertEqual(len(response.context['page_obj']), 3)
+            self.assertFalse(response.context['page_obj'].has_next())
+
+    def test_previous_cursor(self):
+        """Курсор назад возвращает первую страницу"""
+        page = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        first = self.authorized_client.get(page).context['page_obj']
+        second = self.authorized_client.get(
+            page, {'cursor': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(second.number, 2)
+        self.assertTrue(second.has_previous())
+        response = self.authorized_client.get(
+            page, {'cursor': second.previous_cursor}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), list(first)
+        )
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_pages_do_not_overlap(self):
+        """Посты с одинаковой датой не теряются и не повторяются"""
+        page = reverse('posts:profile', kwargs={'username': self.user})
+        seen = []
+        cursor = None
+        while True:
+            page_obj = self.authorized_client.get(
+                page, {'cursor': cursor} if cursor else {}
+            ).context['page_obj']
+            seen.extend(post.pk for post in page_obj)
+            cursor = page_obj.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), Post.objects.count())
+
+    def test_broken_cursor(self):
+        """Испорченный курсор открывает первую страницу"""
+        page = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.authorized_client.get(page, {'cursor': 'мусор'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(
+            len(response.context['page_obj']), settings.NUMBER_OF_POSTS
+        )
+
+    def test_no_count_and_offset(self):
+        """Страница не считает COUNT и не использует OFFSET"""
+        page = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        cursor = self.authorized_client.get(
+            page
+        ).context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(page, {'cursor': cursor})
+        for query in queries.captured_queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('COUNT(', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
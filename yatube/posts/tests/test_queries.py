@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class FeedQueriesTest(TestCase):
+    """Число запросов каждой ленты не зависит от числа постов на странице.
+
+    Если тест упал, скорее всего шаблон карточки начал читать поле,
+    которого нет в `feeds.CARD_FIELDS`, или список постов собран
+    в обход `feeds.feed_posts`.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Elliot')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'doctor_{number}',
+                first_name='Доктор',
+                last_name=str(number),
+            )
+            for number in range(3)
+        ]
+        cls.groups = [
+            Group.objects.create(
+                title=f'Отделение {number}',
+                slug=f'ward-{number}',
+                description='Больничные будни',
+            )
+            for number in range(2)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.create_posts(len(cls.authors))
+
+    @classmethod
+    def create_posts(cls, count):
+        for number in range(count):
+            Post.objects.create(
+                author=cls.authors[number % len(cls.authors)],
+                group=cls.groups[number % len(cls.groups)],
+                text=f'Запись в истории болезни №{number}',
+            )
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        cache.clear()
+
+    def pages(self):
+        author = self.authors[0].username
+        group = self.groups[0].slug
+        # Сессия и пользователь — по запросу у авторизованного клиента.
+        return {
+            (reverse('posts:index'), self.guest_client): 1,
+            (reverse('posts:index'), self.authorized_client): 3,
+            (reverse('posts:group_list', args=[group]), self.guest_client): 2,
+            (
+                reverse('posts:group_list', args=[group]),
+                self.authorized_client,
+            ): 4,
+            (reverse('posts:profile', args=[author]), self.guest_client): 2,
+            # Плюс проверка подписки.
+            (
+                reverse('posts:profile', args=[author]),
+                self.authorized_client,
+            ): 5,
+            # Плюс список «звёзд» среди авторов читателя и, пока его нет
+            # в кеше, список авторов для ключа куска.
+            (reverse('posts:follow_index'), self.authorized_client): 5,
+        }
+
+    def assert_pages_queries(self):
+        for (url, client), queries in self.pages().items():
+            guest = client is self.guest_client
+            with self.subTest(url=url, guest=guest):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['page_obj'])
+
+    def test_feed_queries(self):
+        """Каждая лента читает посты с авторами и группами одним запросом"""
+        self.assert_pages_queries()
+
+    def test_feed_queries_do_not_grow(self):
+        """Полная страница стоит столько же запросов, сколько неполная"""
+        self.create_posts(settings.NUMBER_OF_POSTS * 2)
+        self.assert_pages_queries()
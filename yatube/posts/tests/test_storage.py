@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import thumbnails, variants
+from ..models import ImageBlob, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Jordan')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        patcher = mock.patch.object(thumbnails, 'schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_post(self, name, content=SMALL_GIF):
+        return Post.objects.create(
+            author=self.user,
+            text=name,
+            image=SimpleUploadedFile(name, content, content_type='image/gif'),
+        )
+
+    def references(self, post):
+        return ImageBlob.objects.get(name=post.image.name).references
+
+    def test_same_content_is_stored_once(self):
+        """Одинаковые картинки лежат одним файлом с общим счётчиком"""
+        first = self.create_post('meme.gif')
+        second = self.create_post('copy-of-meme.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [
+            os.path.basename(first.image.name)
+        ])
+        self.assertEqual(self.references(first), 2)
+        first.delete()
+        self.assertEqual(self.references(second), 1)
+        self.assertTrue(second.image.storage.exists(second.image.name))
+
+    def test_changed_image_moves_reference(self):
+        """Замена картинки переносит ссылку на новый файл"""
+        post = Post.objects.get(pk=self.create_post('meme.gif').pk)
+        old_name = post.image.name
+        post.image = SimpleUploadedFile(
+            'other.gif', SMALL_GIF + b'\x00', content_type='image/gif'
+        )
+        post.save()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertEqual(ImageBlob.objects.get(name=old_name).references, 0)
+        self.assertEqual(self.references(post), 1)
+        ImageBlob.objects.update(references=5)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(ImageBlob.objects.get(name=old_name).references, 0)
+        self.assertEqual(self.references(post), 1)
+
+    def test_thumbnails_and_variants_are_shared(self):
+        """Второй пост с той же картинкой не вызывает Pillow"""
+        first = self.create_post('meme.gif')
+        thumbnails.generate(first)
+        second = self.create_post('meme-again.gif')
+        path = 'sorl.thumbnail.engines.pil_engine.Engine.get_image'
+        with mock.patch(path) as get_image:
+            with mock.patch.object(variants, 'encode_variants') as encode:
+                thumbnails.generate(second)
+        get_image.assert_not_called()
+        encode.assert_not_called()
+        self.assertEqual(
+            sorted(second.variants.values_list('image', flat=True)),
+            sorted(first.variants.values_list('image', flat=True)),
+        )
+        variants.build(first)
+        for variant in second.variants.all():
+            with self.subTest(variant=variant.image.name):
+                self.assertTrue(
+                    variant.image.storage.exists(variant.image.name)
+                )
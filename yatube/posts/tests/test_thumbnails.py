@@ -0,0 +1,189 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from .. import thumbnails, variants
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Janitor')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, text):
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            post = Post.objects.create(
+                author=self.user,
+                text=text,
+                image=SimpleUploadedFile(
+                    'small.gif', SMALL_GIF, content_type='image/gif'
+                ),
+            )
+        schedule.assert_called_once_with(post)
+        return post
+
+    def setUp(self):
+        self.post = self.create_post('Кто-то украл мой пенни.')
+        self.client = Client()
+        cache.clear()
+
+    def test_page_does_not_wait_for_pillow(self):
+        """Страницы рисуют заглушку, пока миниатюры не готовы"""
+        pages = {
+            reverse('posts:index'): 'aspect-ratio: 900 / 300',
+            reverse('posts:post_detail', args=[self.post.pk]): (
+                'aspect-ratio: 960 / 339'
+            ),
+        }
+        path = 'sorl.thumbnail.engines.pil_engine.Engine.get_image'
+        for url, placeholder in pages.items():
+            with self.subTest(url=url):
+                with mock.patch(path) as get_image:
+                    response = self.client.get(url)
+                get_image.assert_not_called()
+                self.assertContains(response, placeholder)
+
+    def test_generated_images_replace_placeholder(self):
+        """После фоновой задачи страницы показывают варианты картинки"""
+        self.client.get(reverse('posts:index'))
+        thumbnails.generate(self.post)
+        for geometry in thumbnails.GEOMETRIES:
+            with self.subTest(geometry=geometry):
+                self.assertIsNotNone(
+                    thumbnails.ready_thumbnail(self.post, geometry)
+                )
+        variant = self.post.variants.get(format=variants.FALLBACK)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'{variant.image.url} 2w')
+        self.assertNotContains(response, 'bg-light')
+
+    def test_edit_without_new_image_is_not_scheduled(self):
+        """Правка текста не ставит миниатюры в очередь заново"""
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Я не украл.'
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            post.save()
+        schedule.assert_not_called()
+
+    def test_page_reads_thumbnails_in_one_batch(self):
+        """Миниатюры страницы читаются одним запросом к хранилищу"""
+        posts = [self.post] + [
+            self.create_post(f'Пенни №{number}') for number in range(2)
+        ]
+        # Посты, сохранённые до появления вариантов картинки.
+        with mock.patch.object(variants, 'build'):
+            for post in posts:
+                thumbnails.generate(post)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        for post in response.context['page_obj']:
+            with self.subTest(post=post.pk):
+                card = post.thumbnails[thumbnails.CARD]
+                self.assertContains(response, card.url)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    POST_IMAGE_WIDTHS=(480, 960, 1440),
+    POST_IMAGE_FORMATS=('webp',),
+)
+class VariantTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Ted')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 500), (200, 0, 0)).save(buffer, 'PNG')
+        with mock.patch.object(thumbnails, 'schedule'):
+            self.post = Post.objects.create(
+                author=self.user,
+                text='Я юрист больницы.',
+                image=SimpleUploadedFile(
+                    'wide.png', buffer.getvalue(), content_type='image/png'
+                ),
+            )
+        self.client = Client()
+        cache.clear()
+
+    def test_build_records_widths_and_formats(self):
+        """Варианты строятся по ширинам не больше исходной"""
+        variants.build(self.post)
+        built = set(self.post.variants.values_list('format', 'width'))
+        self.assertEqual(built, {
+            (name, width)
+            for name in ('webp', variants.FALLBACK)
+            for width in (480, 960, 1000)
+        })
+        variant = self.post.variants.get(format='webp', width=480)
+        self.assertEqual(variant.height, 240)
+        self.assertTrue(variant.image.name.endswith('.webp'))
+
+    def test_rebuild_replaces_variants(self):
+        """Повторная сборка не оставляет старых записей и файлов"""
+        variants.build(self.post)
+        old = self.post.variants.get(format='webp', width=480)
+        variants.build(self.post)
+        self.assertEqual(self.post.variants.count(), 6)
+        self.assertFalse(old.image.storage.exists(old.image.name))
+
+    def test_page_renders_srcset_without_filesystem(self):
+        """srcset собирается из модели одним запросом на страницу"""
+        variants.build(self.post)
+        with mock.patch('os.path.exists') as exists:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('posts:index'))
+        exists.assert_not_called()
+        variant_queries = [
+            query for query in queries.captured_queries
+            if 'posts_postimagevariant' in query['sql']
+        ]
+        self.assertEqual(len(variant_queries), 1)
+        webp = self.post.variants.get(format='webp', width=960)
+        self.assertContains(response, f'{webp.image.url} 960w')
+        self.assertContains(response, 'sizes="100vw"')
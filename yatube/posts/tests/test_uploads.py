@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image, ImageFile
+
+from .. import thumbnails
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def png(size):
+    buffer = BytesIO()
+    Image.new('RGB', size, (0, 0, 0)).save(buffer, 'PNG')
+    return SimpleUploadedFile(
+        'black.png', buffer.getvalue(), content_type='image/png'
+    )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Bob_Kelso')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+        self.client.get(reverse('posts:post_create'))
+        self.csrf_token = self.client.cookies['csrftoken'].value
+        patcher = mock.patch.object(thumbnails, 'schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, image, **extra):
+        return self.client.post(reverse('posts:post_create'), {
+            'text': 'Картинка',
+            'image': image,
+            'csrfmiddlewaretoken': self.csrf_token,
+            **extra,
+        })
+
+    def test_image_within_limits_is_saved(self):
+        """Обычная картинка сохраняется, CSRF проверяется"""
+        response = self.create(png((40, 20)))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Post.objects.filter(image__endswith='.png').exists())
+        response = self.create(png((40, 20)), csrfmiddlewaretoken='чужой')
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertEqual(Post.objects.count(), 1)
+
+    @override_settings(POST_IMAGE_MAX_SIZE=100)
+    def test_oversized_file_is_rejected(self):
+        """Слишком тяжёлый файл отвергается с ошибкой формы"""
+        response = self.create(png((400, 200)))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 100\xa0байт.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=10_000)
+    def test_large_dimensions_rejected_by_header(self):
+        """Большие размеры отвергаются по заголовку, без декодирования"""
+        image = png((1000, 1000))
+        with mock.patch.object(ImageFile.ImageFile, 'load') as load:
+            response = self.create(image)
+        load.assert_not_called()
+        self.assertFormError(
+            response,
+            'form',
+            'image',
+            'Слишком большое изображение: больше 10000 пикселей.',
+        )
+        self.assertFalse(Post.objects.exists())
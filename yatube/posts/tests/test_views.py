@@ -109,6 +109,10 @@ class PostViewsTests(TestCase):
         """Кеширование главной страницы"""
         response = self.authorized_client.get(reverse('posts:index'))
         post = response.content
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        response = self.authorized_client.get(reverse('posts:index'))
+        new_post = response.content
+        self.assertEqual(new_post, post)
         Post.objects.create(
             author=self.user,
             group=self.group,
@@ -118,10 +122,6 @@ class PostViewsTests(TestCase):
             )
         )
         response = self.authorized_client.get(reverse('posts:index'))
-        new_post = response.content
-        self.assertEqual(new_post, post)
-        cache.clear()
-        response = self.authorized_client.get(reverse('posts:index'))
         new_new_post = response.content
         self.assertNotEqual(new_new_post, new_post)
 
@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.db import connection, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from sorl.thumbnail.shortcuts import get_thumbnail
+
+from core import metrics
+
+from . import variants
+from .cache import (
+    FEED, author_scope, bump, forget_post_card, post_scope
+)
+from .models import Post
+
+CARD = '900x300'
+DETAIL = '960x339'
+GEOMETRIES = (CARD, DETAIL)
+OPTIONS = {'crop': 'center', 'upscale': True}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+_pending = {}
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(
+                settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def thumbnail_file(image, geometry):
+    """Файл миниатюры под тем же именем, что выберет `get_thumbnail`.
+
+    Опции собираются так же, как в `ThumbnailBackend.get_thumbnail`,
+    но сама картинка не открывается.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(OPTIONS)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def thumbnail_names(image_name):
+    """Имена миниатюр всех `GEOMETRIES` для файла картинки поста."""
+    source = ImageFile(image_name, Post._meta.get_field('image').storage)
+    return [thumbnail_file(source, geometry).name for geometry in GEOMETRIES]
+
+
+def forget_thumbnails(names):
+    """Убирает из key-value хранилища записи об удалённых миниатюрах.
+
+    Без этого `ready_thumbnail` отдавал бы ссылку на несуществующий
+    файл, а так миниатюра просто построится заново.
+    """
+    kvstore = default.kvstore
+    files = [ImageFile(name, default.storage) for name in names]
+    if isinstance(kvstore, KVStore):
+        kvstore._delete_raw(*(add_prefix(file.key) for file in files))
+        return
+    for file in files:
+        kvstore.delete(file, delete_thumbnails=False)
+
+
+def read_many(files):
+    """Записи key-value хранилища sorl для многих файлов сразу.
+
+    Для `cached_db_kvstore` это один `get_many` в кеш и один запрос
+    к базе на промахи; промахи кешируются так же, как делает сам sorl.
+    Остальные хранилища читаются по одной записи.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, KVStore):
+        return {key: kvstore.get(file) for key, file in files.items()}
+    raw_keys = {key: add_prefix(file.key) for key, file in files.items()}
+    values = kvstore.cache.get_many(raw_keys.values())
+    missing = set(raw_keys.values()) - values.keys()
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing
+        ).values_list('key', 'value'))
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(fetched)
+    thumbnails = {}
+    for key, raw in raw_keys.items():
+        value = values[raw]
+        if not value or value == EMPTY_VALUE:
+            thumbnails[key] = None
+        else:
+            thumbnails[key] = deserialize_image_file(value)
+    return thumbnails
+
+
+def prefetch_thumbnails(posts, geometries=GEOMETRIES):
+    """Кладёт в `post.thumbnails` готовые миниатюры всех постов страницы.
+
+    Шаблон после этого не ходит в хранилище за каждой карточкой.
+    Посты с недостающими миниатюрами ставятся в очередь.
+    """
+    files = {}
+    for post in posts:
+        post.thumbnails = getattr(post, 'thumbnails', {})
+        if post.image:
+            for geometry in geometries:
+                if geometry not in post.thumbnails:
+                    files[post, geometry] = thumbnail_file(
+                        post.image, geometry
+                    )
+    if not files:
+        return
+    unfinished = set()
+    missing = 0
+    for (post, geometry), thumbnail in read_many(files).items():
+        post.thumbnails[geometry] = thumbnail
+        if thumbnail is None:
+            unfinished.add(post)
+            missing += 1
+    metrics.THUMBNAIL_LOOKUPS.inc(len(files) - missing, result='ready')
+    metrics.THUMBNAIL_LOOKUPS.inc(missing, result='missing')
+    for post in unfinished:
+        schedule(post)
+
+
+def ready_thumbnail(post, geometry):
+    """Готовая миниатюра поста или None, если её ещё нет.
+
+    Pillow здесь не вызывается: отсутствующая миниатюра ставится
+    в очередь, а шаблон пока рисует заглушку.
+    """
+    prefetch_thumbnails([post], [geometry])
+    return post.thumbnails.get(geometry)
+
+
+def generate(post):
+    """Строит миниатюры и варианты картинки, сбрасывает заглушки в кеше.
+
+    Пост приходит готовым объектом: фоновый поток не читает базу,
+    пока картинка не найдена в хранилище.
+    """
+    image = post.image
+    if not image or not image.storage.exists(image.name):
+        return
+    start = time.perf_counter()
+    for geometry in GEOMETRIES:
+        get_thumbnail(image, geometry, **OPTIONS)
+    variants.build(post)
+    metrics.THUMBNAIL_SECONDS.observe(time.perf_counter() - start)
+    metrics.THUMBNAILS.inc(result='built')
+    forget_post_card(post)
+    bump(FEED, post_scope(post.pk), author_scope(post.author_id))
+
+
+def work(post):
+    try:
+        generate(post)
+    except Exception:
+        metrics.THUMBNAILS.inc(result='error')
+        logger.exception('Не удалось построить миниатюры поста %s', post.pk)
+    finally:
+        with _lock:
+            _pending.pop(post.pk, None)
+        connection.close()
+
+
+def schedule(post):
+    """Отдаёт пост пулу после коммита, без повторов для одного поста."""
+    def submit():
+        pool = executor()
+        with _lock:
+            if post.pk not in _pending:
+                _pending[post.pk] = pool.submit(work, post)
+
+    transaction.on_commit(submit)
+
+
+def wait(post, timeout=None):
+    """Ждёт миниатюры поста не дольше `timeout` секунд.
+
+    Нужна автору сразу после сохранения: страница, на которую его
+    перенаправят, уже покажет картинку. Если Pillow не успел, задача
+    доделается в фоне, а страница нарисует заглушку.
+    """
+    with _lock:
+        future = _pending.get(post.pk)
+    if future is not None:
+        futures.wait([future], timeout)
@@ -0,0 +1,92 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    SkipFile, TemporaryFileUploadHandler
+)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageFile
+
+# Сколько байт файла держать в памяти в поисках заголовка картинки.
+HEADER_LIMIT = 64 * 2 ** 10
+
+
+class PostImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет картинку поста на диск кусками и отбрасывает лишнее сразу.
+
+    Размер файла проверяется на каждом куске, размеры в пикселях — по
+    заголовку, как только Pillow его разобрал. Полного декодирования
+    до этого момента нет, а в памяти держится не больше одного куска
+    и `HEADER_LIMIT` байт заголовка. Причина отказа попадает
+    в `request.upload_errors`, откуда её берёт форма.
+    """
+    chunk_size = 64 * 2 ** 10
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.size = 0
+        self.parser = ImageFile.Parser()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.POST_IMAGE_MAX_SIZE:
+            self.reject(
+                'Файл больше '
+                f'{filesizeformat(settings.POST_IMAGE_MAX_SIZE)}.'
+            )
+        if self.parser is not None:
+            self.check_header(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, raw_data):
+        try:
+            self.parser.feed(raw_data)
+        except Image.DecompressionBombError:
+            self.reject_pixels()
+        except (OSError, SyntaxError, ValueError):
+            # Не картинка — это скажет ImageField.
+            self.parser = None
+            return
+        image = self.parser.image
+        if image is not None:
+            self.parser = None
+            width, height = image.size
+            if width * height > settings.POST_IMAGE_MAX_PIXELS:
+                self.reject_pixels()
+        elif self.size >= HEADER_LIMIT:
+            self.parser = None
+
+    def reject_pixels(self):
+        self.reject(
+            'Слишком большое изображение: больше '
+            f'{settings.POST_IMAGE_MAX_PIXELS} пикселей.'
+        )
+
+    def reject(self, message):
+        self.parser = None
+        if not hasattr(self.request, 'upload_errors'):
+            self.request.upload_errors = {}
+        self.request.upload_errors[self.field_name] = message
+        raise SkipFile(message)
+
+
+def upload_errors(request):
+    return getattr(request, 'upload_errors', {})
+
+
+def post_image_uploads(view):
+    """Подключает `PostImageUploadHandler` к view.
+
+    Обработчики загрузки нельзя менять после чтения `request.POST`,
+    а `CsrfViewMiddleware` читает его раньше view. Поэтому проверка
+    CSRF переносится внутрь, после замены обработчиков.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [PostImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
@@ -17,6 +17,7 @@ urlpatterns = [
         name='add_comment'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('events/', views.new_posts, name='new_posts'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
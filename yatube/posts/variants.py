@@ -0,0 +1,151 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from PIL import Image, ImageOps
+
+try:
+    # AVIF в Pillow приходит плагином; без него строим только WebP.
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+from .models import PostImageVariant
+
+FALLBACK = 'jpeg'
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def modern_formats():
+    """Форматы из `POST_IMAGE_FORMATS`, которые умеет сохранять Pillow."""
+    Image.init()
+    return [
+        name for name in settings.POST_IMAGE_FORMATS
+        if name.upper() in Image.SAVE
+    ]
+
+
+def encode(image, name):
+    if name == FALLBACK:
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, name.upper(), quality=settings.POST_IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def encode_variants(post):
+    """Варианты картинки по всем ширинам и форматам.
+
+    Ширины больше исходной не строятся: вместо них — одна копия
+    в исходную ширину.
+    """
+    with post.image.open('rb') as file:
+        source = ImageOps.exif_transpose(Image.open(file))
+        source.load()
+    if source.mode not in ('RGB', 'RGBA'):
+        alpha = 'A' in source.mode or 'transparency' in source.info
+        source = source.convert('RGBA' if alpha else 'RGB')
+    stem = os.path.splitext(os.path.basename(post.image.name))[0]
+    widths = sorted({
+        min(width, source.width) for width in settings.POST_IMAGE_WIDTHS
+    })
+    variants = []
+    for width in widths:
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.LANCZOS)
+        for name in modern_formats() + [FALLBACK]:
+            variant = PostImageVariant(
+                post=post, format=name, width=width, height=height
+            )
+            variant.image.save(
+                f'{stem}_{width}w.{EXTENSIONS[name]}',
+                encode(resized, name),
+                save=False,
+            )
+            variants.append(variant)
+    return variants
+
+
+def shared_variants(post):
+    """Копии вариантов другого поста с тем же файлом картинки.
+
+    Картинки хранятся по хешу содержимого, так что одинаковое имя
+    значит одинаковые байты, и кодировать их заново незачем.
+    """
+    donor = PostImageVariant.objects.filter(
+        post__image=post.image.name
+    ).exclude(post=post).values_list('post_id', flat=True).first()
+    if donor is None:
+        return None
+    return [
+        PostImageVariant(
+            post=post,
+            format=variant.format,
+            width=variant.width,
+            height=variant.height,
+            image=variant.image.name,
+        )
+        for variant in PostImageVariant.objects.filter(post_id=donor)
+    ]
+
+
+def build(post):
+    """Пересобирает варианты картинки поста.
+
+    Файлы старых вариантов удаляются, если на них не ссылается
+    другой пост с той же картинкой.
+    """
+    variants = shared_variants(post)
+    if variants is None:
+        variants = encode_variants(post)
+    with transaction.atomic():
+        old = list(post.variants.all())
+        PostImageVariant.objects.filter(
+            pk__in=[variant.pk for variant in old]
+        ).delete()
+        PostImageVariant.objects.bulk_create(variants)
+    for variant in old:
+        if not PostImageVariant.objects.filter(
+            image=variant.image.name
+        ).exists():
+            variant.image.delete(save=False)
+
+
+def prefetch_variants(posts):
+    """Один запрос на варианты картинок всех постов страницы."""
+    prefetch_related_objects(
+        [post for post in posts if post.image], 'variants'
+    )
+
+
+def picture_sources(post):
+    """`srcset` по форматам: современные идут в `<source>`, JPEG — в `<img>`.
+
+    Всё берётся из `PostImageVariant`, файловая система не трогается.
+    Если вариантов ещё нет, возвращает `([], None)`.
+    """
+    by_format = {}
+    for variant in post.variants.all():
+        by_format.setdefault(variant.format, []).append(variant)
+    if FALLBACK not in by_format:
+        return [], None
+    sources = [
+        {'type': MIME_TYPES[name], 'srcset': srcset(by_format[name])}
+        for name in MIME_TYPES
+        if name != FALLBACK and name in by_format
+    ]
+    fallback = by_format[FALLBACK]
+    return sources, {
+        'srcset': srcset(fallback),
+        'src': fallback[-1].image.url,
+    }
+
+
+def srcset(variants):
+    return ', '.join(
+        f'{variant.image.url} {variant.width}w' for variant in variants
+    )
@@ -1,10 +1,19 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.views.decorators.cache import cache_page
 from django.conf import settings
-from django.core.paginator import Paginator
-
+from django.utils.functional import SimpleLazyObject
+
+from . import events, thumbnails, variants
+from .cache import (
+    FEED, follow_scopes, forget_post_card, fragment_cached, post_scope
+)
+from .counters import author_posts_count
+from .feeds import (
+    FollowFeedPaginator, feed_posts, follow_feed, followed_celebrities
+)
 from .models import Post, Group, User, Follow
 from .forms import PostForm, PostFormEdit, CommentForm
+from .paginator import CursorPaginator
+from .uploads import post_image_uploads, upload_errors
 
 
 def authorized_only(func):
@@ -15,36 +24,63 @@ def authorized_only(func):
     return check_user
 
 
-def piginator(request, post):
-    paginator = Paginator(post, settings.NUMBER_OF_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+def piginator(request, post, paginator_class=CursorPaginator, **kwargs):
+    paginator = paginator_class(post, settings.NUMBER_OF_POSTS, **kwargs)
+    page = paginator.get_cursor_page(request.GET.get('cursor'))
+    variants.prefetch_variants(page.object_list)
+    thumbnails.prefetch_thumbnails(
+        [item for item in page.object_list
+         if item.image and not item.variants.all()],
+        [thumbnails.CARD],
+    )
+    return page
+
+
+def lazy_piginator(request, post, *args, **kwargs):
+    """Страница, которая читается из базы только при первом обращении.
+
+    Если тело страницы нашлось в кеше, запросов к ленте не будет.
+    """
+    return SimpleLazyObject(
+        lambda: piginator(request, post, *args, **kwargs)
+    )
+
+
+def events_since(request):
+    """Номер в журнале событий для плашки новых постов; None — без неё."""
+    return events.last_seq() if events.enabled(request) else None
 
 
-@cache_page(20)
 def index(request):
     template = 'posts/index.html'
-    posts = Post.objects.select_related('author', 'group').all()
-    return render(request, template, {'page_obj': piginator(request, posts)})
+    posts = feed_posts()
+    context = {
+        'page_obj': lazy_piginator(request, posts),
+        'cache_scopes': [FEED],
+        'events_since': events_since(request),
+    }
+    return render(request, template, context)
 
 
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = feed_posts(group.posts.all())
     context = {
-        'page_obj': piginator(request, posts),
+        'page_obj': lazy_piginator(request, posts),
         'group': group,
+        'cache_scopes': [FEED],
     }
     return render(request, template, context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('counter'), username=username
+    )
     user = request.user
     template = 'posts/profile.html'
-    posts = author.posts.all()
+    posts = feed_posts(author.posts.all())
     if request.user.is_authenticated:
         following = Follow.objects.filter(user=user, author=author).exists()
     else:
@@ -52,39 +88,50 @@ def profile(request, username):
     context = {
         'author': author,
         'user': user,
-        'page_obj': piginator(request, posts),
-        'count': posts.count(),
+        'page_obj': lazy_piginator(request, posts),
+        'count': author_posts_count(author),
         'following': following,
+        'cache_scopes': [FEED],
     }
     return render(request, template, context)
 
 
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    one_post = get_object_or_404(Post, id=post_id)
-    comments = one_post.comments.all()
+    one_post = get_object_or_404(
+        Post.objects.select_related('author__counter', 'group'), id=post_id
+    )
+    comments = one_post.comments.select_related('author')
     form = CommentForm()
     context = {
         'one_post': one_post,
         'form': form,
-        'comments': comments
+        'comments': comments,
+        'cache_scopes': [FEED, post_scope(one_post.pk)],
     }
     return render(request, template, context)
 
 
+@post_image_uploads
 @authorized_only
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        upload_errors=upload_errors(request),
+    )
     if request.method == 'POST':
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            thumbnails.wait(post, settings.THUMBNAIL_SAVE_WAIT)
             return redirect('posts:profile', username=request.user.username)
         return render(request, 'posts/create_post.html', {'form': form})
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@post_image_uploads
 def post_edit(request, post_id):
     one_post = get_object_or_404(Post, id=post_id)
     if request.user != one_post.author:
@@ -93,10 +140,12 @@ def post_edit(request, post_id):
         request.POST or None,
         instance=one_post,
         files=request.FILES or None,
+        upload_errors=upload_errors(request),
     )
     if request.method == 'POST':
         if form.is_valid():
-            form.save()
+            forget_post_card(one_post)
+            thumbnails.wait(form.save(), settings.THUMBNAIL_SAVE_WAIT)
             return redirect('posts:post_detail', post_id=post_id)
     return render(request, 'posts/create_post.html',
                   {'form': form, 'is_edit': True, 'post_id': post_id})
@@ -116,12 +165,30 @@ def add_comment(request, post_id):
 
 @authorized_only
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
+    user = request.user
     template = 'posts/follow.html'
     title = 'Посты ваших любимых авторов'
+    cache_scopes = follow_scopes(user.pk)
+
+    def page():
+        return piginator(
+            request,
+            follow_feed(user),
+            FollowFeedPaginator,
+            celebrities=followed_celebrities(user),
+        )
+
+    # Лента и «звёзды» читаются только без куска в кеше. На промахе
+    # страница нужна шаблону всё равно, и в контекст идёт обычный Page.
+    if fragment_cached(request, 'follow_index', cache_scopes, [user.pk]):
+        page_obj = SimpleLazyObject(page)
+    else:
+        page_obj = page()
     context = {
         'title': title,
-        'page_obj': piginator(request, posts),
+        'page_obj': page_obj,
+        'cache_scopes': cache_scopes,
+        'events_since': events_since(request),
     }
     return render(request, template, context)
 
@@ -141,3 +208,19 @@ def profile_unfollow(request, username):
     following = Follow.objects.filter(user=request.user, author=author)
     following.delete()
     return redirect('posts:profile', username=username)
+
+
+def new_posts(request):
+    """Поток SSE: сколько новых постов вышло после `since`."""
+    since = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+    try:
+        since = int(since)
+    except (TypeError, ValueError):
+        since = events.last_seq()
+    user = request.user
+    if user.is_authenticated:
+        following = Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True
+        )
+        return events.EventStream(since, user.pk, following)
+    return events.EventStream(since)
@@ -0,0 +1,17 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Django 2.2 has no ASGI support of its own: views run in a thread pool
+behind ``core.asgi.ASGIHandler``. Serve it with any ASGI server::
+
+    uvicorn yatube.asgi:application
+"""
+
+import os
+
+from core.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+application = ASGIHandler()
@@ -25,6 +25,17 @@ SECRET_KEY = '@n^x^^c+b^fv6musr2%y(9h#ov8oe3^=-9acj@b@8-eqqve=50'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 THUMBNAIL_DEBUG = True
+# Миниатюры строятся в фоновых потоках, а не в запросе страницы.
+# Запрос, сохранивший пост, ждёт их не дольше THUMBNAIL_SAVE_WAIT секунд.
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_SAVE_WAIT = 2
+# Ширины и форматы вариантов картинки поста для srcset; JPEG — запасной.
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_FORMATS = ('avif', 'webp')
+POST_IMAGE_QUALITY = 80
+# Картинки больше этого отвергаются ещё при загрузке, по заголовку.
+POST_IMAGE_MAX_SIZE = 10 * 2 ** 20
+POST_IMAGE_MAX_PIXELS = 40_000_000
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -52,6 +63,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,7 +84,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.profiling.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -82,6 +95,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
             ],
+            'builtins': ['core.templatetags.profiling'],
         },
     },
 ]
@@ -134,12 +148,19 @@ USE_TZ = True
 
 NUMBER_OF_POSTS = 10
 
+# Посты авторов с таким числом подписчиков не раскладываются по лентам,
+# а читаются при открытии ленты подписок.
+FEED_CELEBRITY_FOLLOWERS = 1000
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Тесты пишут файлы во временный каталог, а не в MEDIA_ROOT.
+TEST_RUNNER = 'core.testing.TestRunner'
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
@@ -151,8 +172,58 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.permission_denied_view'
 
+# Доля запросов, которые профилирует ProfilingMiddleware (0.01 — каждый
+# сотый), и как часто снимается стек. Профили пишутся в PROFILING_DIR.
+PROFILING_SAMPLE_RATE = 0
+PROFILING_INTERVAL = 0.005
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Потоки, в которых ASGI-вход (yatube/asgi.py) выполняет view. Тела
+# запросов и ответы читает и пишет цикл событий, потоки заняты только
+# работой самих view.
+ASGI_THREADS = 8
+
+# Уведомления о новых постах (SSE). Плашка на лентах включается
+# EVENTS_STREAM или сама под ASGI; под WSGI поток не ждёт событий,
+# а отвечает сразу, и браузер переспрашивает раз в несколько секунд.
+# Журнал событий — файл, общий для процессов на машине; процесс читает
+# его раз в EVENTS_POLL_INTERVAL секунд, пока у него есть слушатели.
+# Пустое событие уходит раз в EVENTS_HEARTBEAT секунд, поток
+# закрывается через EVENTS_MAX_AGE.
+EVENTS_STREAM = False
+EVENTS_LOCATION = os.path.join(BASE_DIR, 'events.sqlite3')
+EVENTS_POLL_INTERVAL = 0.5
+EVENTS_HEARTBEAT = 15
+EVENTS_MAX_AGE = 300
+
+# Метрики для /metrics/. Чтобы сводить их с нескольких процессов
+# (воркеров gunicorn), укажите общий каталог METRICS_DIR: каждый процесс
+# пишет туда свой файл не реже раза в METRICS_FLUSH_INTERVAL секунд.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 1
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Страницы кешируются до первой записи, которая их меняет.
+POSTS_CACHE_TIMEOUT = 60 * 60
+
+# Общий кеш — один файл на машину: все воркеры видят одни записи
+# и одни поколения. Перед ним в каждом процессе — маленький L1 для
+# горячих ключей; журнал инвалидаций держит L1 в согласии с L2.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache-invalidations.sqlite3'),
+        'OPTIONS': {
+            'L2': 'shared',
+            'MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
 }